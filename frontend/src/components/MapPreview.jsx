@@ -32,7 +32,7 @@ import {
 import { ChevronDownIcon, AddIcon, TimeIcon, CalendarIcon, InfoIcon, HamburgerIcon, CloseIcon } from "@chakra-ui/icons";
 import { FaExpand, FaCompress } from 'react-icons/fa';
 import L from 'leaflet';
-import { getRoute } from '../services/mapService';
+import { getRoutesBatch } from '../services/mapService';
 
 // Fix for default marker icon
 delete L.Icon.Default.prototype._getIconUrl;
@@ -61,6 +61,9 @@ const NAVBAR_HEIGHT = 64; // px
 
 const MapPreview = ({ route, selectedDay = 'day1' }) => {
   const [actualRoute, setActualRoute] = useState(null);
+  const [dayRoutes, setDayRoutes] = useState({});
+  const [dayErrors, setDayErrors] = useState({});
+  const [isFallback, setIsFallback] = useState(false);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const [isFullscreen, setIsFullscreen] = useState(false);
@@ -69,38 +72,60 @@ const MapPreview = ({ route, selectedDay = 'day1' }) => {
     setIsFullscreen(!isFullscreen);
   };
 
+  // Lấy tuyến đường của tất cả các ngày một lần, đổi ngày không cần gọi lại API
   useEffect(() => {
-    const fetchRoute = async () => {
-      if (!route || !route[selectedDay] || route[selectedDay].length < 2) {
-        setActualRoute(null);
-        if (route && route[selectedDay] && route[selectedDay].length < 2) {
-          setError('Không đủ điểm để vẽ tuyến đường.');
-        } else {
-          setError(null);
-        }
-        return;
-      }
+    if (!route || Object.keys(route).length === 0) {
+      setDayRoutes({});
+      setDayErrors({});
+      return;
+    }
 
+    let cancelled = false;
+    const fetchRoutes = async () => {
       setLoading(true);
       setError(null);
 
       try {
-        const locations = route[selectedDay].map(loc => ({
-          lat: loc.latitude,
-          lng: loc.longitude
-        }));
-        const routeData = await getRoute(locations);
-        setActualRoute(routeData);
+        const { routes, errors } = await getRoutesBatch(route);
+        if (!cancelled) {
+          setDayRoutes(routes);
+          setDayErrors(errors);
+        }
       } catch (err) {
-        setError('Failed to fetch route data. Please try again later.');
-        setActualRoute(null);
+        if (!cancelled) {
+          // Cả request lỗi: mọi ngày đều vẽ đường thẳng thay vì để trống bản đồ
+          setDayRoutes({});
+          setDayErrors(Object.fromEntries(Object.keys(route).map(day => [day, err.message])));
+        }
       } finally {
-        setLoading(false);
+        if (!cancelled) setLoading(false);
       }
     };
 
-    fetchRoute();
-  }, [route, selectedDay]);
+    fetchRoutes();
+    return () => { cancelled = true; };
+  }, [route]);
+
+  useEffect(() => {
+    setIsFallback(false);
+    if (!route || !route[selectedDay] || route[selectedDay].length < 2) {
+      setActualRoute(null);
+      if (route && route[selectedDay] && route[selectedDay].length < 2) {
+        setError('Không đủ điểm để vẽ tuyến đường.');
+      } else {
+        setError(null);
+      }
+      return;
+    }
+    setError(null);
+    if (!dayRoutes[selectedDay] && dayErrors[selectedDay]) {
+      // Ngày này không lấy được tuyến đường: nối thẳng các điểm và báo cho người dùng
+      setActualRoute(route[selectedDay].map(stop => [stop.latitude, stop.longitude]));
+      setIsFallback(true);
+      return;
+    }
+    setActualRoute(dayRoutes[selectedDay] || null);
+  }, [route, selectedDay, dayRoutes, dayErrors]);
 
   if (!route || Object.keys(route).length === 0) {
     return (
@@ -177,10 +202,12 @@ const MapPreview = ({ route, selectedDay = 'day1' }) => {
           />
           {actualRoute && actualRoute.length > 0 && (
             <Polyline
+              key={`${selectedDay}-${isFallback}`}
               positions={actualRoute}
               color={generateDayColor(parseInt(selectedDay.replace('day', '')) - 1)}
               weight={4}
               opacity={0.7}
+              dashArray={isFallback ? '8 8' : undefined}
             />
           )}
           {currentRoute?.map((location, index) => (
@@ -215,6 +242,20 @@ const MapPreview = ({ route, selectedDay = 'day1' }) => {
           <Spinner size="xl" color="blue.500" />
         </Box>
       )}
+      {/* Leg routing failed: straight-line fallback */}
+      {isFallback && !error && (
+        <Alert
+          status="warning"
+          position="absolute"
+          top={4}
+          right={4}
+          maxW="sm"
+          zIndex={2200}
+        >
+          <AlertIcon />
+          Không tìm được đường đi cho {selectedDay}, đang hiển thị đường thẳng giữa các điểm.
+        </Alert>
+      )}
       {/* Error Alert */}
       {error && (
         <Alert
@@ -485,8 +485,8 @@ const Chat = ({ user, showItinerary, onCloseItinerary }) => {
       console.log('API Response:', res.data);
       console.log('Raw output text:', res.data.output);
 
-      // Parse route from the output text
-      const routeData = parseRouteFromText(res.data.output);
+      // Service trả route đã validate trong res.data.route; parse từ text chỉ là fallback
+      const routeData = res.data.route || parseRouteFromText(res.data.output);
       console.log('Parsed route data:', routeData);
 
       // Tách JSON khỏi response để hiển thị
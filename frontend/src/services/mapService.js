@@ -1,13 +1,25 @@
-export const getRoute = async (locations) => {
-  // Chuyển đổi sang [lng, lat] đúng chuẩn OpenRouteService
-  const coordinates = locations.map(loc => [loc.lng, loc.lat]);
-  const response = await fetch('http://localhost:8000/api/route', {
+// Lấy tuyến đường của tất cả các ngày trong một request (route: { day1: [{latitude, longitude}, ...] })
+// Trả về { routes: { day1: [[lat, lng], ...] }, errors: { dayN: "lý do" } }; ngày lỗi không có trong routes
+export const getRoutesBatch = async (route) => {
+  const routes = {};
+  Object.entries(route || {}).forEach(([day, stops]) => {
+    if (stops && stops.length >= 2) {
+      routes[day] = stops.map(loc => [loc.longitude, loc.latitude]);
+    }
+  });
+  if (Object.keys(routes).length === 0) return { routes: {}, errors: {} };
+
+  const response = await fetch('http://localhost:8000/api/routes/batch', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ coordinates })
+    body: JSON.stringify({ routes })
   });
-  if (!response.ok) throw new Error('Failed to fetch route');
+  if (!response.ok) throw new Error('Failed to fetch routes');
   const data = await response.json();
-  // Trả về mảng [lat, lng] cho Polyline
-  return data.features[0].geometry.coordinates.map(coord => [coord[1], coord[0]]);
-};
\ No newline at end of file
+  // Đổi sang [lat, lng] cho Polyline
+  const result = {};
+  Object.entries(data.routes || {}).forEach(([day, geojson]) => {
+    result[day] = geojson.features[0].geometry.coordinates.map(coord => [coord[1], coord[0]]);
+  });
+  return { routes: result, errors: data.errors || {} };
+};
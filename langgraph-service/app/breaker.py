@@ -0,0 +1,105 @@
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from app.latency import LatencyWindow
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open"""
+
+class CircuitBreaker:
+    """Per-provider breaker over a rolling window of call outcomes and latencies.
+
+    closed -> open when the failure rate over the last `window` calls reaches
+    `failure_rate` (after at least `min_calls`); open -> half_open after
+    `open_seconds`, where one probe call decides between closed and open again.
+    The call timeout adapts to the observed p99 latency.
+    """
+
+    def __init__(self, name: str, window: int = 50, min_calls: int = 10, failure_rate: float = 0.5,
+                 open_seconds: float = 30, default_timeout: float = 60, min_timeout: float = 10,
+                 max_timeout: float = 120, timeout_multiplier: float = 2):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.latency = LatencyWindow(window)
+        self._outcomes = deque(maxlen=window)  # True = thành công
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == "open" and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = "half_open"
+            self._probe_in_flight = False
+        return self._state
+
+    def available(self) -> bool:
+        """Whether a call would currently be let through (does not reserve the probe)"""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probe_in_flight)
+
+    def acquire(self) -> bool:
+        """Reserve a call slot; in half_open only a single probe is allowed"""
+        if not self.available():
+            self.rejected += 1
+            return False
+        if self._state == "half_open":
+            self._probe_in_flight = True
+        return True
+
+    def release(self) -> None:
+        """Give the slot back without an outcome (the call was cancelled)"""
+        self._probe_in_flight = False
+
+    def timeout(self) -> float:
+        if len(self.latency) < self.min_calls:
+            return self.default_timeout
+        adaptive = self.latency.percentile(99) * self.timeout_multiplier
+        return min(max(adaptive, self.min_timeout), self.max_timeout)
+
+    def record_success(self, seconds: Optional[float] = None) -> None:
+        """`seconds=None` counts the outcome only, for calls whose latency would skew the adaptive timeout"""
+        if seconds is not None:
+            self.latency.record(seconds)
+        self._outcomes.append(True)
+        if self._state == "half_open":
+            self._state = "closed"
+            self._outcomes.clear()
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._outcomes.append(False)
+        self._probe_in_flight = False
+        if self._state == "half_open":
+            self._trip()
+        elif self._state == "closed" and len(self._outcomes) >= self.min_calls:
+            failures = self._outcomes.count(False)
+            if failures / len(self._outcomes) >= self.failure_rate:
+                self._trip()
+
+    def _trip(self) -> None:
+        self._state = "open"
+        self._opened_at = time.monotonic()
+        self.trips += 1
+        print(f"⚠️ Circuit breaker '{self.name}' opened")
+
+    def stats(self) -> Dict[str, Any]:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "calls": calls,
+            "error_rate": round(self._outcomes.count(False) / calls, 3) if calls else 0.0,
+            "timeout_s": round(self.timeout(), 2),
+            "latency": self.latency.stats(),
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
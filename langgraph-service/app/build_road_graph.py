@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Build the offline road graph used by /api/route from an OpenStreetMap extract.
+
+Usage (từ thư mục langgraph-service):
+    python -m app.build_road_graph vietnam-latest.osm.pbf      # cần `pip install osmium`
+    python -m app.build_road_graph da-lat.osm                  # .osm / .osm.bz2 XML, cho vùng nhỏ
+
+Extract Việt Nam: https://download.geofabrik.de/asia/vietnam.html
+"""
+
+import argparse
+import bz2
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from app.road_graph import DEFAULT_GRAPH_PATH, HIGHWAY_SPEEDS_KMH, haversine_m, write_graph
+
+def oneway_direction(tags: Dict[str, str]) -> int:
+    """1 = chỉ chiều thuận, -1 = chỉ chiều ngược, 0 = hai chiều"""
+    value = tags.get("oneway", "").lower()
+    if value in ("yes", "true", "1"):
+        return 1
+    if value == "-1":
+        return -1
+    if value == "no":
+        return 0
+    if tags.get("highway") in ("motorway", "motorway_link") or tags.get("junction") == "roundabout":
+        return 1
+    return 0
+
+def _routable(tags: Dict[str, str]) -> bool:
+    return tags.get("highway") in HIGHWAY_SPEEDS_KMH and tags.get("access") not in ("no", "private") \
+        and tags.get("motor_vehicle") != "no"
+
+class GraphBuilder:
+    """Collect routable ways into typed arrays: one entry per way node occurrence and per directed edge.
+
+    No per-node or per-edge Python objects are kept, so a country extract fits in memory;
+    OSM node ids are made dense (and shared nodes merged) once, with numpy, in `write`.
+    """
+
+    def __init__(self):
+        self.osm_ids = array("q")
+        self.lats, self.lons = array("d"), array("d")
+        # Cạnh có hướng giữa hai vị trí trong osm_ids, trọng số là số giây đi hết
+        self.sources, self.targets = array("q"), array("q")
+        self.weights = array("f")
+
+    def add_way(self, highway: str, oneway: int, nodes: Iterable[Tuple[int, float, float]]) -> None:
+        speed_mps = HIGHWAY_SPEEDS_KMH[highway] / 3.6
+        previous = None
+        for osm_id, lat, lon in nodes:
+            current = len(self.osm_ids)
+            self.osm_ids.append(osm_id)
+            self.lats.append(lat)
+            self.lons.append(lon)
+            if previous is not None:
+                seconds = haversine_m(self.lats[previous], self.lons[previous], lat, lon) / speed_mps
+                if oneway >= 0:
+                    self._edge(previous, current, seconds)
+                if oneway <= 0:
+                    self._edge(current, previous, seconds)
+            previous = current
+
+    def _edge(self, a: int, b: int, seconds: float) -> None:
+        self.sources.append(a)
+        self.targets.append(b)
+        self.weights.append(seconds)
+
+    def write(self, output: str) -> Dict[str, int]:
+        """Renumber OSM nodes densely (sorted by OSM id) and write the CSR graph"""
+        # asarray đọc thẳng buffer của array, không sao chép
+        _, first, dense = np.unique(np.asarray(self.osm_ids, dtype=np.int64), return_index=True, return_inverse=True)
+        lats = np.asarray(self.lats, dtype=np.float64)[first]
+        lons = np.asarray(self.lons, dtype=np.float64)[first]
+        sources = dense[np.asarray(self.sources, dtype=np.int64)]
+        targets = dense[np.asarray(self.targets, dtype=np.int64)]
+        return write_graph(output, lats, lons, sources, targets, self.weights)
+
+def read_pbf(path: str, builder: GraphBuilder) -> None:
+    """Feed routable ways from a .osm.pbf file to `builder` via pyosmium (node locations resolved by osmium)"""
+    try:
+        import osmium
+    except ImportError:
+        raise SystemExit("Reading .pbf needs pyosmium: pip install osmium")
+
+    class Handler(osmium.SimpleHandler):
+        def way(self, w):
+            tags = {tag.k: tag.v for tag in w.tags}
+            if not _routable(tags):
+                return
+            nodes = [(n.ref, n.location.lat, n.location.lon) for n in w.nodes if n.location.valid()]
+            if len(nodes) >= 2:
+                # Thêm ngay vào builder thay vì giữ lại mọi way trong bộ nhớ
+                builder.add_way(tags["highway"], oneway_direction(tags), nodes)
+
+    Handler().apply_file(path, locations=True)
+
+def read_xml(path: str, builder: GraphBuilder) -> None:
+    """Feed routable ways from an .osm XML file to `builder`, in two passes (ways first, then their node coordinates)"""
+    def open_file():
+        return bz2.open(path, "rb") if path.endswith(".bz2") else open(path, "rb")
+
+    raw_ways: List[Tuple[str, int, array]] = []
+    needed = set()
+    with open_file() as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag == "way":
+                tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+                if _routable(tags):
+                    refs = array("q", (int(nd.get("ref")) for nd in elem.iter("nd")))
+                    raw_ways.append((tags["highway"], oneway_direction(tags), refs))
+                    needed.update(refs)
+                elem.clear()
+            elif elem.tag in ("node", "relation"):
+                elem.clear()
+
+    coords: Dict[int, Tuple[float, float]] = {}
+    with open_file() as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag == "node":
+                node_id = int(elem.get("id"))
+                if node_id in needed:
+                    coords[node_id] = (float(elem.get("lat")), float(elem.get("lon")))
+            elem.clear()
+
+    for highway, oneway, refs in raw_ways:
+        nodes = [(ref, *coords[ref]) for ref in refs if ref in coords]
+        if len(nodes) >= 2:
+            builder.add_way(highway, oneway, nodes)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build the offline road graph from an OSM extract")
+    parser.add_argument("source", help=".osm.pbf (needs pyosmium) or .osm / .osm.bz2 XML extract")
+    parser.add_argument("--output", default=os.getenv("ROAD_GRAPH_PATH", DEFAULT_GRAPH_PATH),
+                        help="Output graph file (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    builder = GraphBuilder()
+    read = read_pbf if args.source.endswith(".pbf") else read_xml
+    read(args.source, builder)
+    stats = builder.write(args.output)
+    print(f"✅ Road graph: {stats['nodes']} nodes / {stats['edges']} edges "
+          f"written to {args.output} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+def normalize_text(text: str) -> str:
+    """Normalize free text before hashing (Unicode NFC, lowercase, collapsed whitespace)"""
+    text = unicodedata.normalize("NFC", text or "")
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def make_cache_key(prompt: str, ai_provider: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Stable hash of a prompt, provider and model parameters"""
+    payload = json.dumps(
+        {
+            "prompt": normalize_text(prompt),
+            "provider": (ai_provider or "").lower(),
+            "params": params or {},
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Two-tier cache: in-memory LRU backed by an optional SQLite store.
+
+    Values must be JSON serializable. Both tiers share the same TTL; the memory
+    tier is bounded by `max_entries` and the disk tier by `disk_max_entries`
+    (least recently accessed rows are pruned first). Disk access is blocking,
+    so the async helpers run it in the default thread pool.
+    """
+
+    PRUNE_EVERY = 100
+    BUSY_TIMEOUT = 5.0  # giây chờ khi worker khác đang giữ lock ghi
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 256,
+        disk_max_entries: int = 5000,
+        ttl_seconds: float = 86400,
+        table: str = "responses",
+    ):
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.ttl_seconds = ttl_seconds
+        self.table = table
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.disk_errors = 0
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            try:
+                # Nhiều worker dùng chung file: WAL cho phép đọc song song, busy_timeout chờ lock thay vì lỗi ngay
+                self._db = sqlite3.connect(path, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+                self._db.execute(f"PRAGMA busy_timeout={int(self.BUSY_TIMEOUT * 1000)}")
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"❌ Error opening cache {path} ({table}), using memory only: {e}")
+                self._db = None
+
+    def _disk_error(self, action: str, e: Exception) -> None:
+        """A failed disk read/write degrades to a miss / skipped write instead of failing the request"""
+        self.disk_errors += 1
+        print(f"Error {action} cache {self.table}: {e}")
+        try:
+            self._db.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _get_memory(self, key: str, now: float) -> Optional[tuple]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[0] < now:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return entry
+
+    def _set_memory(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.evictions += 1
+
+    def _get_disk(self, key: str, now: float) -> Optional[tuple]:
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        return row[1], json.loads(row[0])
+
+    def _set_disk(self, key: str, value: Any, expires_at: float, now: float) -> None:
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at, now),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune_disk(now)
+            self._db.commit()
+
+    def _prune_disk(self, now: float) -> None:
+        """Drop expired rows, then the least recently accessed ones above the size bound"""
+        self._db.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+        cursor = self._db.execute(
+            f"DELETE FROM {self.table} WHERE key NOT IN "
+            f"(SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT ?)",
+            (self.disk_max_entries,),
+        )
+        self.evictions += max(cursor.rowcount, 0)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Look up a value, promoting disk hits into memory"""
+        now = time.time()
+        entry = self._get_memory(key, now)
+        if entry is None:
+            try:
+                entry = self._get_disk(key, now)
+            except sqlite3.Error as e:
+                with self._lock:
+                    self._disk_error("reading", e)
+                entry = None
+            if entry is not None:
+                self.disk_hits += 1
+                self._set_memory(key, entry[1], entry[0])
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        self._set_memory(key, value, expires_at)
+        try:
+            self._set_disk(key, value, expires_at, now)
+        except sqlite3.Error as e:
+            with self._lock:
+                self._disk_error("writing", e)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        # Memory hits không cần nhảy sang thread pool
+        entry = self._get_memory(key, time.time())
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+        if self._db is None:
+            self.misses += 1
+            return None
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any) -> None:
+        if self._db is None:
+            self.set(key, value)
+            return
+        await asyncio.to_thread(self.set, key, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self.table}")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "disk_errors": self.disk_errors,
+            "memory_entries": len(self._memory),
+            "persistent": self._db is not None,
+        }
@@ -0,0 +1,196 @@
+import math
+import os
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.gazetteer import tokenize
+
+DEFAULT_STORE_PATH = ".cache/wikivoyage.sqlite3"
+
+# Tham số BM25 chuẩn
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SCHEMA = """
+CREATE TABLE articles (id INTEGER PRIMARY KEY, title TEXT NOT NULL, title_key TEXT NOT NULL);
+CREATE INDEX articles_title_key ON articles (title_key);
+CREATE TABLE sections (
+    id INTEGER PRIMARY KEY, article_id INTEGER NOT NULL, position INTEGER NOT NULL,
+    heading TEXT NOT NULL, text TEXT NOT NULL, length INTEGER NOT NULL
+);
+CREATE INDEX sections_article ON sections (article_id, position);
+CREATE TABLE postings (term TEXT NOT NULL, section_id INTEGER NOT NULL, tf INTEGER NOT NULL);
+CREATE INDEX postings_term ON postings (term);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value REAL NOT NULL);
+"""
+
+class Section(NamedTuple):
+    title: str
+    heading: str
+    text: str
+
+def title_key(title: str) -> str:
+    """Lookup key that ignores accents, case, spaces and punctuation ("Đà Lạt" == "Dalat")"""
+    return "".join(tokenize(title))
+
+def bm25_scores(
+    query_terms: Iterable[str],
+    postings: Dict[str, List[Tuple[int, int]]],
+    lengths: Dict[int, int],
+    total_docs: int,
+    avg_length: float,
+) -> Dict[int, float]:
+    """BM25 score per document id given each term's postings [(doc_id, tf)]"""
+    scores: Dict[int, float] = defaultdict(float)
+    for term in set(query_terms):
+        docs = postings.get(term)
+        if not docs:
+            continue
+        idf = math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+        for doc_id, tf in docs:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_id] / (avg_length or 1))
+            scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+    return scores
+
+def build_store(path: str, articles: Iterable[Tuple[str, List[Tuple[str, str]]]]) -> Dict[str, int]:
+    """Write articles [(title, [(heading, text)])] and their BM25 index to a fresh SQLite file"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    db = sqlite3.connect(tmp_path)
+    db.executescript(SCHEMA)
+    article_count = section_count = total_length = 0
+    for title, sections in articles:
+        cursor = db.execute("INSERT INTO articles (title, title_key) VALUES (?, ?)", (title, title_key(title)))
+        article_id = cursor.lastrowid
+        article_count += 1
+        for position, (heading, text) in enumerate(sections):
+            # Tiêu đề bài và mục cũng được index để query "Da Lat eat" khớp đúng mục
+            terms = Counter(tokenize(f"{title} {heading} {text}"))
+            length = sum(terms.values())
+            cursor = db.execute(
+                "INSERT INTO sections (article_id, position, heading, text, length) VALUES (?, ?, ?, ?, ?)",
+                (article_id, position, heading, text, length),
+            )
+            db.executemany(
+                "INSERT INTO postings (term, section_id, tf) VALUES (?, ?, ?)",
+                ((term, cursor.lastrowid, tf) for term, tf in terms.items()),
+            )
+            section_count += 1
+            total_length += length
+    db.executemany(
+        "INSERT INTO meta (key, value) VALUES (?, ?)",
+        [("sections", section_count), ("avg_length", total_length / section_count if section_count else 0.0)],
+    )
+    db.commit()
+    db.close()
+    os.replace(tmp_path, path)
+    return {"articles": article_count, "sections": section_count}
+
+class ContextStore:
+    """Read side of the offline Wikivoyage store built by `app.ingest_wikivoyage`"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version = _file_version(path)
+        self._db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        self.total_sections = int(meta.get("sections", 0))
+        self.avg_length = float(meta.get("avg_length", 0.0))
+
+    def find_article(self, title: str) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM articles WHERE title_key = ? LIMIT 1", (title_key(title),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def article_sections(self, article_id: int) -> List[Section]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT a.title, s.heading, s.text FROM sections s JOIN articles a ON a.id = s.article_id "
+                "WHERE s.article_id = ? ORDER BY s.position",
+                (article_id,),
+            ).fetchall()
+        return [Section(*row) for row in rows]
+
+    def search(self, query: str, k: int = 5, article_id: Optional[int] = None) -> List[Tuple[float, Section]]:
+        """Top-k sections for `query` by BM25, optionally restricted to one article"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths: Dict[int, int] = {}
+        sql = (
+            "SELECT p.section_id, p.tf, s.length FROM postings p JOIN sections s ON s.id = p.section_id "
+            "WHERE p.term = ?"
+        )
+        with self._lock:
+            for term in set(terms):
+                if article_id is None:
+                    rows = self._db.execute(sql, (term,)).fetchall()
+                else:
+                    rows = self._db.execute(sql + " AND s.article_id = ?", (term, article_id)).fetchall()
+                postings[term] = [(section_id, tf) for section_id, tf, _ in rows]
+                lengths.update((section_id, length) for section_id, _, length in rows)
+
+        scores = bm25_scores(terms, postings, lengths, self.total_sections, self.avg_length)
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        if not top:
+            return []
+        with self._lock:
+            rows = {
+                row[0]: Section(*row[1:])
+                for row in self._db.execute(
+                    "SELECT s.id, a.title, s.heading, s.text FROM sections s JOIN articles a ON a.id = s.article_id "
+                    f"WHERE s.id IN ({','.join('?' * len(top))})",
+                    [section_id for section_id, _ in top],
+                )
+            }
+        return [(score, rows[section_id]) for section_id, score in top]
+
+    def destination_sections(self, destination: str) -> List[Section]:
+        """All sections of the article for `destination`, falling back to the best BM25 hit"""
+        article_id = self.find_article(destination)
+        if article_id is None:
+            hits = self.search(destination, k=1)
+            if not hits:
+                return []
+            article_id = self.find_article(hits[0][1].title)
+            if article_id is None:
+                return []
+        return self.article_sections(article_id)
+
+def _file_version(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+_store: Optional[ContextStore] = None
+_store_lock = threading.Lock()
+
+def get_context_store() -> Optional[ContextStore]:
+    """Process-wide store, None until the ingestion command has been run.
+
+    The file is checked on every call: a store ingested, or re-ingested (build_store
+    replaces the file), while the service is running is opened on the next call.
+    """
+    global _store
+    path = os.getenv("WIKIVOYAGE_STORE_PATH", DEFAULT_STORE_PATH)
+    version = _file_version(path) if path else None
+    if version is None:
+        return _store
+    if _store is not None and _store.path == path and _store.version == version:
+        return _store
+    with _store_lock:
+        if _store is None or _store.path != path or _store.version != version:
+            # Request đang đọc store cũ vẫn giữ tham chiếu tới nó; connection cũ đóng khi không còn ai dùng
+            _store = ContextStore(path)
+    return _store
@@ -0,0 +1,130 @@
+import json
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "data", "vietnam_gazetteer.json")
+
+# Khi một câu khớp nhiều địa danh, địa danh cụ thể hơn được ưu tiên
+_TYPE_PRIORITY = {"attraction": 3, "city": 2, "province": 1, "region": 0}
+# Từ (đã bỏ dấu) đứng ngay trước địa danh cho biết đó là điểm đến hay điểm xuất phát
+_DESTINATION_CUES = {"di", "den", "toi", "len", "ra", "vao", "ve", "tham", "lich", "choi", "ghe"}
+_ORIGIN_CUES = {"tu"}
+_END = "\0"
+
+def fold(text: str) -> str:
+    """Lowercase and strip Vietnamese accents ("Đà Lạt" -> "da lat")"""
+    text = unicodedata.normalize("NFD", text or "").lower().replace("đ", "d")
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+def tokenize(text: str) -> List[str]:
+    """Accent-folded word tokens"""
+    return re.findall(r"[a-z0-9]+", fold(text))
+
+@dataclass(frozen=True)
+class Place:
+    name: str
+    type: str
+    wikivoyage: str  # Tên bài viết Wikivoyage (không dấu) dùng để tìm context
+    province: str
+    lat: float
+    lon: float
+    aliases: Tuple[str, ...] = ()
+
+class Gazetteer:
+    """Token trie over accent-folded place names and aliases.
+
+    Matching walks the trie from every token position and keeps the longest
+    match, so a lookup costs O(tokens * longest name) with no model call.
+    """
+
+    def __init__(self, places: List[Place]):
+        self.places = places
+        self._trie: Dict[str, dict] = {}
+        self._by_article: Dict[str, Place] = {}
+        for idx, place in enumerate(places):
+            for form in (place.name, *place.aliases):
+                self._insert(tokenize(form), idx)
+            # Nhiều địa danh chung một bài Wikivoyage: giữ địa danh khái quát hơn làm tâm điểm đến
+            current = self._by_article.get(fold(place.wikivoyage))
+            if current is None or _TYPE_PRIORITY.get(place.type, 0) < _TYPE_PRIORITY.get(current.type, 0):
+                self._by_article[fold(place.wikivoyage)] = place
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_GAZETTEER_PATH) -> "Gazetteer":
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+        return cls([
+            Place(
+                name=row["name"],
+                type=row.get("type", "city"),
+                wikivoyage=row.get("wikivoyage") or row["name"],
+                province=row.get("province", ""),
+                lat=float(row["lat"]),
+                lon=float(row["lon"]),
+                aliases=tuple(row.get("aliases", [])),
+            )
+            for row in rows
+        ])
+
+    def _insert(self, tokens: List[str], idx: int) -> None:
+        if not tokens:
+            return
+        node = self._trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        current = node.get(_END)
+        # Trùng tên sau khi bỏ dấu: giữ địa danh cụ thể hơn
+        if current is None or _TYPE_PRIORITY.get(self.places[idx].type, 0) > _TYPE_PRIORITY.get(self.places[current].type, 0):
+            node[_END] = idx
+
+    def _find(self, tokens: List[str]) -> List[Tuple[int, int, Place]]:
+        matches = []
+        i = 0
+        while i < len(tokens):
+            node = self._trie
+            best = None
+            j = i
+            while j < len(tokens) and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if _END in node:
+                    best = (j, node[_END])
+            if best is None:
+                i += 1
+                continue
+            matches.append((i, best[0], self.places[best[1]]))
+            i = best[0]
+        return matches
+
+    def find_all(self, text: str) -> List[Tuple[int, int, Place]]:
+        """All non-overlapping longest matches as (start_token, end_token, place)"""
+        return self._find(tokenize(text))
+
+    def by_wikivoyage(self, title: str) -> Optional[Place]:
+        """Place whose Wikivoyage article is `title` (what match_destination returns)"""
+        return self._by_article.get(fold(title))
+
+    def match(self, text: str) -> Optional[Place]:
+        """Best guess for the travel destination mentioned in `text`"""
+        tokens = tokenize(text)
+        matches = self._find(tokens)
+        if not matches:
+            return None
+
+        def previous(m):
+            return tokens[m[0] - 1] if m[0] > 0 else ""
+
+        candidates = [m for m in matches if previous(m) not in _ORIGIN_CUES] or matches
+        cued = [m for m in candidates if previous(m) in _DESTINATION_CUES]
+        pool = cued or candidates
+        best = max(pool, key=lambda m: (_TYPE_PRIORITY.get(m[2].type, 0), -m[0]))
+        return best[2]
+
+@lru_cache(maxsize=1)
+def get_gazetteer() -> Gazetteer:
+    """Process-wide gazetteer, loaded on first use"""
+    return Gazetteer.load(os.getenv("GAZETTEER_PATH", DEFAULT_GAZETTEER_PATH))
@@ -1,34 +1,85 @@
-from langgraph.graph import StateGraph
-from typing import TypedDict
-from app.steps import preprocess_input, rag_retrieve_context, call_ai, save_result, return_output
+from langgraph.graph import StateGraph, START, END
+from typing import Annotated, Any, Callable, Dict, TypedDict
+import functools
+import operator
+import time
+from app.metrics import node_duration
+from app.steps import preprocess_input, rag_retrieve_context, call_ai, structure_route, optimize_stops, save_result, return_output
 
 class TravelState(TypedDict):
     user_input: str
     prompt: str
     itinerary: str
     output: str
+    success: bool
     ai_provider: str
     history: list  # Danh sách các tin nhắn chat (dict: {role, content})
+    history_text: str  # History đã rút gọn, đưa vào tin nhắn user của prompt
+    context: str  # Context Wikivoyage đã chọn, ghép vào prompt ở CallAI
+    destination: str  # Tên bài Wikivoyage của điểm đến (gazetteer hoặc LLM)
+    context_token_budget: int  # Số token tối đa cho context RAG
+    context_top_k: int
+    context_chunks: int  # Số chunk context thực sự được chọn
+    context_tokens: int
+    bypass_cache: bool  # Bỏ qua response cache cho request này
+    cache_hit: bool
+    hedge: bool  # Cho phép gửi song song sang provider còn lại khi provider chính chậm
+    served_by: str  # Provider thực sự trả lời (khác ai_provider khi hedge thắng)
+    edit_mode: bool  # Câu hỏi tiếp theo: yêu cầu patch thay vì sinh lại lịch trình
+    edit_base: str  # Lịch trình trước đó mà patch được áp lên
+    edit_applied: bool
+    route: dict  # Route JSON đã validate ({"day1": [stop, ...]}), None nếu không trích được
+    optimize_route: bool  # Sắp xếp lại điểm dừng mỗi ngày cho quãng đường ngắn nhất
+    route_optimization: dict  # Quãng đường trước/sau (km) theo ngày
+    # Các nhánh song song cùng ghi vào đây nên cần reducer (nối list);
+    # reducer cũng là điều kiện để StateGraph cho phép fan-out nhiều edge
+    errors: Annotated[list, operator.add]
+
+def timed_node(name: str, fn: Callable) -> Callable:
+    """Record each run of a node in the travel_node_duration_seconds histogram"""
+    @functools.wraps(fn)
+    async def node(state: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        status = "exception"
+        try:
+            result = await fn(state)
+            # Node bắt lỗi và ghi vào `errors` thay vì raise
+            status = "error" if isinstance(result, dict) and result.get("errors") else "ok"
+            return result
+        finally:
+            node_duration.observe(time.perf_counter() - started, node=name, status=status)
+    return node
 
 def build_travel_graph():
     """Build and compile the travel planning graph"""
     graph = StateGraph(TravelState)
 
     # Add nodes
-    graph.add_node("PreprocessInput", preprocess_input)
-    graph.add_node("RAGRetrieveContext", rag_retrieve_context)
-    graph.add_node("CallAI", call_ai)
-    graph.add_node("SaveResult", save_result)
-    graph.add_node("ReturnOutput", return_output)
-
-    # Set entry and finish nodes
-    graph.set_entry_point("PreprocessInput")
-    graph.set_finish_point("ReturnOutput")
+    for name, fn in (
+        ("PreprocessInput", preprocess_input),
+        ("RAGRetrieveContext", rag_retrieve_context),
+        ("CallAI", call_ai),
+        ("ExtractRoute", structure_route),
+        ("OptimizeRoute", optimize_stops),
+        ("SaveResult", save_result),
+        ("ReturnOutput", return_output),
+    ):
+        graph.add_node(name, timed_node(name, fn))
+
+    # Fan-out: formatting the prompt does not depend on destination extraction
+    graph.add_edge(START, "PreprocessInput")
+    graph.add_edge(START, "RAGRetrieveContext")
 
-    # Add edges
-    graph.add_edge("PreprocessInput", "RAGRetrieveContext")
-    graph.add_edge("RAGRetrieveContext", "CallAI")
+    # Fan-in: CallAI waits for both branches and joins prompt + context
+    graph.add_edge(["PreprocessInput", "RAGRetrieveContext"], "CallAI")
+
+    # SaveResult only schedules background work, ReturnOutput does not wait on it
     graph.add_edge("CallAI", "SaveResult")
-    graph.add_edge("SaveResult", "ReturnOutput")
+    # Route JSON is validated (and re-asked if broken) before the response is returned
+    graph.add_edge("CallAI", "ExtractRoute")
+    graph.add_edge("ExtractRoute", "OptimizeRoute")
+    graph.add_edge("OptimizeRoute", "ReturnOutput")
+    graph.add_edge("SaveResult", END)
+    graph.set_finish_point("ReturnOutput")
 
     return graph.compile() 
\ No newline at end of file
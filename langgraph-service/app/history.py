@@ -0,0 +1,90 @@
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+from app.tokens import count_tokens
+
+# Block JSON route ở cuối mỗi lịch trình; model đôi khi quên code fence
+_ROUTE_FENCE = re.compile(r"```json\s*([\s\S]*?)\s*```")
+_ROUTE_OBJECT = re.compile(r'(\{[\s\S]*"route"[\s\S]*\})')
+
+def find_route_block(text: str) -> Optional[str]:
+    """Raw JSON text of the trailing route block, None if there is none"""
+    if not text:
+        return None
+    match = _ROUTE_FENCE.search(text) or _ROUTE_OBJECT.search(text)
+    return match.group(1) if match else None
+
+def strip_route_block(text: str) -> str:
+    return _ROUTE_OBJECT.sub("", _ROUTE_FENCE.sub("", text or "")).strip()
+
+def _messages(history) -> List[Dict[str, str]]:
+    if not isinstance(history, list):
+        return []
+    return [msg for msg in history if isinstance(msg, dict) and msg.get("content")]
+
+def _line(msg: Dict[str, str], text: str) -> str:
+    speaker = "Người dùng" if msg.get("role", "user") == "user" else "Bot"
+    return f"{speaker}: {text}\n"
+
+def render_turns(messages: List[Dict[str, str]]) -> str:
+    """Messages as dialogue lines, without their route JSON (sent once, separately)"""
+    return "".join(_line(msg, strip_route_block(msg.get("content", ""))) for msg in messages)
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Longest word-bounded prefix of `text` within `max_tokens`"""
+    tokens = count_tokens(text)
+    while tokens > max_tokens and text:
+        text = text[: max(int(len(text) * max_tokens / tokens * 0.95), 0)].rsplit(" ", 1)[0]
+        tokens = count_tokens(text)
+    return text
+
+def split_history(history, token_budget: int) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """(older, recent): the newest messages that fit `token_budget` stay verbatim.
+
+    The last message is always kept, truncated if it alone exceeds the budget.
+    """
+    messages = _messages(history)
+    recent: List[Dict[str, str]] = []
+    used = 0
+    for msg in reversed(messages):
+        tokens = count_tokens(_line(msg, strip_route_block(msg["content"])))
+        if used + tokens > token_budget:
+            if not recent:
+                recent.append({**msg, "content": truncate_tokens(strip_route_block(msg["content"]), token_budget)})
+            break
+        recent.append(msg)
+        used += tokens
+    recent.reverse()
+    return messages[: len(messages) - len(recent)], recent
+
+def latest_itinerary(history) -> Optional[str]:
+    """Most recent bot message that carries a route block"""
+    for msg in reversed(_messages(history)):
+        if msg.get("role", "user") != "user" and find_route_block(msg["content"]):
+            return msg["content"]
+    return None
+
+def latest_route_block(history) -> Optional[str]:
+    itinerary = latest_itinerary(history)
+    return find_route_block(itinerary) if itinerary else None
+
+def history_chain_keys(messages: List[Dict[str, str]]) -> List[str]:
+    """keys[i] identifies messages[:i + 1]; used to find the longest already-summarized prefix"""
+    keys, digest = [], b""
+    for msg in messages:
+        digest = hashlib.sha256(digest + f"{msg.get('role', 'user')}\0{msg['content']}".encode("utf-8")).digest()
+        keys.append("history:" + digest.hex())
+    return keys
+
+def extractive_summary(messages: List[Dict[str, str]], max_tokens: int) -> str:
+    """Cheap local summary while the LLM summary is not cached yet: first sentence of each turn"""
+    lines = []
+    for msg in messages:
+        text = strip_route_block(msg["content"]).strip()
+        first = re.split(r"(?<=[.!?])\s|\n", text, maxsplit=1)[0]
+        lines.append(_line(msg, truncate_tokens(first, 60)).strip())
+    # Vượt ngân sách thì bỏ các lượt cũ nhất trước
+    while lines and count_tokens(" ".join(lines)) > max_tokens:
+        lines.pop(0)
+    return " ".join(lines)
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from app.metrics import upstream_duration, upstream_requests
+
+# Cấu hình pool dùng chung cho mọi request ra ngoài (OpenAI, Wikivoyage, OpenRouteService)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 60))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def default_timeout() -> httpx.Timeout:
+    return httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that frees the per-host slot once it has been read or closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, semaphore: asyncio.Semaphore):
+        self._stream = stream
+        self._semaphore = semaphore
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._semaphore.release()
+
+class HostLimitedTransport(httpx.AsyncBaseTransport):
+    """Caps concurrent in-flight requests per host on top of the global pool limits"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_per_host: int):
+        self._transport = transport
+        self._max_per_host = max_per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self._max_per_host)
+        await semaphore.acquire()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            semaphore.release()
+            raise
+        response.stream = _ReleasingStream(response.stream, semaphore)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+async def _on_request(request: httpx.Request) -> None:
+    request.extensions["started"] = time.perf_counter()
+
+async def _on_response(response: httpx.Response) -> None:
+    host = response.request.url.host
+    started = response.request.extensions.get("started")
+    if started is not None:
+        upstream_duration.observe(time.perf_counter() - started, host=host)
+    upstream_requests.inc(host=host, status=response.status_code)
+
+_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Process-wide pooled client (keep-alive, HTTP/2 when `h2` is installed)"""
+    global _client
+    if _client is None or _client.is_closed:
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+        transport = httpx.AsyncHTTPTransport(http2=http2_available(), limits=limits, retries=1)
+        _client = httpx.AsyncClient(
+            transport=HostLimitedTransport(transport, HTTP_MAX_PER_HOST),
+            timeout=default_timeout(),
+            follow_redirects=True,
+            event_hooks={"request": [_on_request], "response": [_on_response]},
+        )
+    return _client
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Load a Wikivoyage dump or snapshot into the offline context store.
+
+Usage (từ thư mục langgraph-service):
+    python -m app.ingest_wikivoyage enwikivoyage-latest-pages-articles.xml.bz2 --vietnam-only
+    python -m app.ingest_wikivoyage ./wikivoyage_html/   # thư mục các trang .html đã tải
+"""
+
+import argparse
+import bz2
+import gzip
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from typing import Iterator, List, Tuple
+
+from app.context_store import DEFAULT_STORE_PATH, build_store, title_key
+from app.gazetteer import get_gazetteer
+
+Article = Tuple[str, List[Tuple[str, str]]]
+
+LISTING_TYPES = ("see", "do", "buy", "eat", "drink", "sleep", "go", "listing", "marker")
+_HEADING_RE = re.compile(r"^(={2,3})\s*(.*?)\s*\1\s*$", re.MULTILINE)
+_LISTING_RE = re.compile(r"\{\{\s*(?:%s)\s*\|([^{}]*)\}\}" % "|".join(LISTING_TYPES), re.IGNORECASE)
+_TEMPLATE_RE = re.compile(r"\{\{[^{}]*\}\}")
+_TABLE_RE = re.compile(r"\{\|.*?\|\}", re.DOTALL)
+_FILE_LINK_RE = re.compile(r"\[\[(?:File|Image):[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]", re.IGNORECASE)
+_LINK_RE = re.compile(r"\[\[(?:[^|\]]*\|)?([^\]]*)\]\]")
+_EXTERNAL_LINK_RE = re.compile(r"\[https?://\S+\s*([^\]]*)\]")
+_REF_RE = re.compile(r"<ref[^>/]*(?:/>|>.*?</ref>)", re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]+>")
+
+def _listing_to_text(match: re.Match) -> str:
+    """{{eat|name=Bánh căn Nhà Chung|...|content=...}} -> "Bánh căn Nhà Chung: ..." """
+    fields = {}
+    for part in match.group(1).split("|"):
+        key, sep, value = part.partition("=")
+        if sep:
+            fields[key.strip().lower()] = value.strip()
+    name = fields.get("name", "")
+    details = [fields.get(key, "") for key in ("content", "description", "price", "hours")]
+    details = " ".join(d for d in details if d)
+    return f"{name}: {details}" if details else name
+
+def clean_wikitext(text: str) -> str:
+    """Strip MediaWiki markup down to readable text, keeping listing names and descriptions"""
+    text = _REF_RE.sub("", text)
+    text = re.sub(r"<!--.*?-->", "", text, flags=re.DOTALL)
+    text = _LISTING_RE.sub(_listing_to_text, text)
+    # Template lồng nhau: xóa từ trong ra ngoài
+    previous = None
+    while previous != text:
+        previous = text
+        text = _TEMPLATE_RE.sub("", text)
+    text = _TABLE_RE.sub("", text)
+    text = _FILE_LINK_RE.sub("", text)
+    text = _LINK_RE.sub(r"\1", text)
+    text = _EXTERNAL_LINK_RE.sub(r"\1", text)
+    text = _TAG_RE.sub("", text)
+    text = text.replace("'''", "").replace("''", "")
+    text = re.sub(r"^[*#:;]+\s*", "- ", text, flags=re.MULTILINE)
+    text = re.sub(r"[ \t]+", " ", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+def split_sections(wikitext: str) -> List[Tuple[str, str]]:
+    """Split an article on == / === headings into (heading, cleaned text) pairs"""
+    sections = []
+    heading = "Introduction"
+    parent = ""
+    position = 0
+    for match in _HEADING_RE.finditer(wikitext):
+        body = clean_wikitext(wikitext[position:match.start()])
+        if body:
+            sections.append((heading, body))
+        title = clean_wikitext(match.group(2))
+        if len(match.group(1)) == 2:
+            parent = title
+            heading = title
+        else:
+            heading = f"{parent} > {title}" if parent else title
+        position = match.end()
+    body = clean_wikitext(wikitext[position:])
+    if body:
+        sections.append((heading, body))
+    return sections
+
+def _open_dump(path: str):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+def iter_xml_dump(path: str) -> Iterator[Tuple[str, str]]:
+    """(title, wikitext) for every main-namespace, non-redirect page of a MediaWiki XML dump"""
+    with _open_dump(path) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag.rsplit("}", 1)[-1] != "page":
+                continue
+            fields = {child.tag.rsplit("}", 1)[-1]: child for child in elem}
+            title = fields["title"].text if "title" in fields else None
+            ns = fields["ns"].text if "ns" in fields else "0"
+            revision = fields.get("revision")
+            text = None
+            if revision is not None:
+                for child in revision:
+                    if child.tag.rsplit("}", 1)[-1] == "text":
+                        text = child.text
+            if title and text and ns == "0" and "redirect" not in fields and not text.lstrip().lower().startswith("#redirect"):
+                yield title, text
+            elem.clear()
+
+def html_sections(html: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """Title and (heading, text) sections of a Wikivoyage HTML page, split on h2/h3"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    heading_tag = soup.find("h1")
+    title = heading_tag.get_text(strip=True) if heading_tag else ""
+    content = soup.find("div", id="mw-content-text") or soup.body
+    if content is None:
+        return title, []
+    sections = []
+    heading, parts = "Introduction", []
+    for node in content.find_all(["h2", "h3", "p", "li"]):
+        if node.name in ("h2", "h3"):
+            if parts:
+                sections.append((heading, "\n".join(parts)))
+            heading, parts = node.get_text(" ", strip=True), []
+        else:
+            text = node.get_text(" ", strip=True)
+            if text:
+                parts.append(text)
+    if parts:
+        sections.append((heading, "\n".join(parts)))
+    return title, sections
+
+def iter_html_snapshot(directory: str) -> Iterator[Article]:
+    """Articles from a directory of saved Wikivoyage .html pages"""
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith((".html", ".htm")):
+            continue
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            title, sections = html_sections(f.read())
+        if sections:
+            yield title or os.path.splitext(name)[0].replace("_", " "), sections
+
+def is_vietnam_article(title: str, wikitext: str, known_titles: set) -> bool:
+    """Keep gazetteer destinations and anything placed under Vietnam by {{IsPartOf}}/mentions"""
+    if title_key(title) in known_titles:
+        return True
+    head = wikitext[:3000]
+    if re.search(r"\{\{\s*IsPartOf\s*\|[^}]*Vietnam", head, re.IGNORECASE):
+        return True
+    return wikitext.count("Vietnam") >= 5
+
+def iter_articles(source: str, vietnam_only: bool) -> Iterator[Article]:
+    if os.path.isdir(source):
+        yield from iter_html_snapshot(source)
+        return
+    known_titles = set()
+    if vietnam_only:
+        for place in get_gazetteer().places:
+            known_titles.add(title_key(place.wikivoyage))
+            known_titles.add(title_key(place.name))
+    for title, wikitext in iter_xml_dump(source):
+        if vietnam_only and not is_vietnam_article(title, wikitext, known_titles):
+            continue
+        sections = split_sections(wikitext)
+        if sections:
+            yield title, sections
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build the offline Wikivoyage context store")
+    parser.add_argument("source", help="MediaWiki XML dump (.xml/.xml.bz2/.xml.gz) or a directory of .html pages")
+    parser.add_argument("--store", default=os.getenv("WIKIVOYAGE_STORE_PATH", DEFAULT_STORE_PATH),
+                        help="Output SQLite file (default: %(default)s)")
+    parser.add_argument("--vietnam-only", action="store_true", help="Only keep Vietnam-related articles from an XML dump")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    stats = build_store(args.store, iter_articles(args.source, args.vietnam_only))
+    print(f"✅ Indexed {stats['articles']} articles / {stats['sections']} sections "
+          f"into {args.store} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
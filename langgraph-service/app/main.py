@@ -1,10 +1,27 @@
+from app.startup import startup_report  # trước các import khác để đo thời gian import
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional
+import asyncio
 import logging
+import os
+import time
 from app.graph import build_travel_graph
-from app.routes.route import router as route_router
+from app.steps import (
+    token_sink, response_cache, destination_flight, context_flight, llm_flight,
+    ttft_windows, hedge_stats, hedge_delay, HEDGE_ENABLED, breakers, summary_cache, providers,
+    warm_up, WARMUP_ENABLED
+)
+from app.routes.route import router as route_router, route_cache
+from app.road_graph import get_road_graph
+from app.http_client import close_http_client
+from app.route_extraction import RouteStop
+from app.metrics import REGISTRY, CONTENT_TYPE, gauge, collected_counter, request_duration
+from app.responses import JSONResponseClass, CompressionMiddleware, dumps, select_fields
+
+startup_report.mark("imports")
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,7 +30,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Travel Planning Service",
     description="AI-powered travel planning service using LangGraph",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=JSONResponseClass
 )
 
 # Add CORS middleware
@@ -25,20 +43,126 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Build the compiled graph
-compiled_graph = build_travel_graph()
+# Nén response từ COMPRESSION_MIN_SIZE byte trở lên (brotli nếu đã cài, không thì gzip); SSE không bị nén
+if os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes"):
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", 1024)),
+        gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", 6)),
+        brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4)),
+    )
+
+# Build the compiled graph (một lần cho mỗi worker process)
+with startup_report.phase("graph_compile"):
+    compiled_graph = build_travel_graph()
 
 app.include_router(route_router)
 
+def _cache_counts() -> dict:
+    counts = {}
+    for name, cache in (("responses", response_cache), ("routes", route_cache), ("history_summaries", summary_cache)):
+        stats = cache.stats()
+        for result in ("hits", "disk_hits", "misses", "evictions"):
+            counts[(name, result)] = stats.get(result, 0)
+    return counts
+
+collected_counter("travel_cache_events_total", "Response/route/summary cache hits, misses and evictions",
+      ("cache", "result"), collect=_cache_counts)
+gauge("travel_circuit_breaker_open", "1 while a provider's circuit breaker is not closed",
+      ("provider",), collect=lambda: {(p,): int(b.state != "closed") for p, b in breakers.items()})
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Latency histogram per endpoint and status code"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Dùng path template của route (vd. /api/route) để không tạo label theo từng URL
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        request_duration.observe(time.perf_counter() - started, method=request.method, path=path, status=status)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics in text exposition format"""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.on_event("startup")
+async def warm_up_service():
+    """Warm-up hook: load indexes and provider SDKs before serving, then log the startup report"""
+    if WARMUP_ENABLED:
+        await asyncio.to_thread(warm_up)
+        with startup_report.phase("warmup:road_graph"):
+            await asyncio.to_thread(get_road_graph)
+    startup_report.mark("ready")
+    logger.info(f"Startup phases (ms): {startup_report.as_dict()['phases_ms']}")
+
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    """Close pooled keep-alive connections"""
+    await close_http_client()
+
 class TravelRequest(BaseModel):
     text: str
-    ai_provider: Optional[str] = "gpt"  # "gpt" or "gemini"
+    ai_provider: Optional[str] = "gpt"  # tên provider đã đăng ký: "gpt", "gemini"
     history: Optional[list] = []  # Danh sách các tin nhắn chat
+    bypass_cache: Optional[bool] = False  # True để luôn gọi AI provider
+    hedge: Optional[bool] = None  # None = theo HEDGE_ENABLED
+    edit_mode: Optional[bool] = None  # None = theo EDIT_MODE_ENABLED
+    optimize_route: Optional[bool] = None  # None = theo ROUTE_OPTIMIZE_ENABLED
 
 class TravelResponse(BaseModel):
     output: str
     success: bool
     ai_provider: str
+    cached: bool = False
+    served_by: Optional[str] = None
+    edited: bool = False  # True khi lịch trình được cập nhật bằng patch
+    route: Optional[Dict[str, List[RouteStop]]] = None  # Route đã validate, tách khỏi output
+    route_optimization: Optional[dict] = None  # Quãng đường tiết kiệm được khi optimize_route
+
+# Batch: số request chạy đồng thời tối đa và số item tối đa mỗi batch
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 4))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))
+
+class BatchTravelRequest(BaseModel):
+    requests: List[TravelRequest]
+    max_concurrency: Optional[int] = None  # Không vượt quá BATCH_MAX_CONCURRENCY
+
+class BatchItemResult(BaseModel):
+    index: int
+    success: bool
+    output: str = ""
+    ai_provider: str
+    cached: bool = False
+    route: Optional[Dict[str, List[RouteStop]]] = None
+    error: Optional[str] = None
+    duration_ms: float
+
+class BatchTravelResponse(BaseModel):
+    results: List[BatchItemResult]
+    succeeded: int
+    failed: int
+    duration_ms: float
+
+def _invalid_provider_detail() -> str:
+    return f"Invalid AI provider. Use one of: {', '.join(providers.names())}"
+
+def _graph_input(travel_request: TravelRequest) -> dict:
+    """Initial graph state for a request"""
+    return {
+        "user_input": travel_request.text,
+        "ai_provider": travel_request.ai_provider,
+        "history": travel_request.history or [],
+        "bypass_cache": bool(travel_request.bypass_cache),
+        "hedge": travel_request.hedge,
+        "edit_mode": travel_request.edit_mode,
+        "optimize_route": travel_request.optimize_route
+    }
 
 @app.get("/")
 async def root():
@@ -46,7 +170,7 @@ async def root():
     return {
         "message": "Travel Planning Service is running",
         "status": "healthy",
-        "available_providers": ["gpt", "gemini"]
+        "available_providers": providers.names()
     }
 
 @app.post("/generate-itinerary", response_model=TravelResponse)
@@ -56,41 +180,176 @@ async def generate_itinerary(travel_request: TravelRequest):
         logger.info(f"Generating itinerary with provider: {travel_request.ai_provider}")
         
         # Validate AI provider
-        if travel_request.ai_provider not in ["gpt", "gemini"]:
+        if travel_request.ai_provider not in providers:
             raise HTTPException(
                 status_code=400, 
-                detail="Invalid AI provider. Use 'gpt' or 'gemini'"
+                detail=_invalid_provider_detail()
             )
         
-        # Invoke the compiled graph
-        result = compiled_graph.invoke({
-            "user_input": travel_request.text,
-            "ai_provider": travel_request.ai_provider,
-            "history": travel_request.history or []
-        })
+        # Invoke the compiled graph (async so the event loop keeps serving other requests)
+        result = await compiled_graph.ainvoke(_graph_input(travel_request))
         
         return TravelResponse(
             output=result.get("output", ""),
             success=result.get("success", False),
-            ai_provider=travel_request.ai_provider
+            ai_provider=travel_request.ai_provider,
+            cached=result.get("cache_hit", False),
+            served_by=result.get("served_by"),
+            edited=bool(result.get("edit_applied")),
+            route=result.get("route"),
+            route_optimization=result.get("route_optimization")
         )
         
     except Exception as e:
         logger.error(f"Error generating itinerary: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.post("/generate-itineraries", response_model=BatchTravelResponse)
+async def generate_itineraries(batch: BatchTravelRequest):
+    """Generate many itineraries concurrently, reporting per-item results and timings
+
+    Items share the compiled graph and its RAG/cache layers. A failing item is
+    reported in its own result and does not fail the batch.
+    """
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="'requests' must not be empty")
+    if len(batch.requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} requests per batch")
+
+    concurrency = min(batch.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    logger.info(f"Generating {len(batch.requests)} itineraries with concurrency {concurrency}")
+
+    async def run_item(index: int, travel_request: TravelRequest) -> BatchItemResult:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                if travel_request.ai_provider not in providers:
+                    raise ValueError(_invalid_provider_detail())
+                result = await compiled_graph.ainvoke(_graph_input(travel_request))
+                errors = result.get("errors") or []
+                return BatchItemResult(
+                    index=index,
+                    success=result.get("success", False),
+                    output=result.get("output", ""),
+                    ai_provider=travel_request.ai_provider,
+                    cached=result.get("cache_hit", False),
+                    route=result.get("route"),
+                    error="; ".join(errors) or None,
+                    duration_ms=round((time.perf_counter() - started) * 1000, 1)
+                )
+            except Exception as e:
+                logger.error(f"Error generating batch item {index}: {str(e)}")
+                return BatchItemResult(
+                    index=index,
+                    success=False,
+                    ai_provider=travel_request.ai_provider or "",
+                    error=str(e),
+                    duration_ms=round((time.perf_counter() - started) * 1000, 1)
+                )
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run_item(i, r) for i, r in enumerate(batch.requests)))
+    succeeded = sum(1 for r in results if r.success)
+    return BatchTravelResponse(
+        results=results,
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        duration_ms=round((time.perf_counter() - started) * 1000, 1)
+    )
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {dumps(data)}\n\n"
+
+@app.post("/generate-itinerary/stream")
+async def generate_itinerary_stream(travel_request: TravelRequest):
+    """Generate travel itinerary, streaming provider tokens as server-sent events
+
+    Emits `token` events ({"text": ...}) while the model is generating, then one
+    `done` event with the parsed route JSON and success flag, or an `error` event.
+    """
+    logger.info(f"Streaming itinerary with provider: {travel_request.ai_provider}")
+
+    if travel_request.ai_provider not in providers:
+        raise HTTPException(
+            status_code=400,
+            detail=_invalid_provider_detail()
+        )
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run_graph():
+        # Set inside the task so only this request's nodes see the sink
+        token_sink.set(queue)
+        try:
+            return await compiled_graph.ainvoke(_graph_input(travel_request))
+        finally:
+            queue.put_nowait(None)
+
+    async def event_stream():
+        task = asyncio.create_task(run_graph())
+        try:
+            while True:
+                token = await queue.get()
+                if token is None:
+                    break
+                yield _sse_event("token", {"text": token})
+
+            result = await task
+            yield _sse_event("done", {
+                "route": result.get("route"),
+                "route_optimization": result.get("route_optimization"),
+                "success": result.get("success", False),
+                "ai_provider": travel_request.ai_provider,
+                "served_by": result.get("served_by")
+            })
+        except Exception as e:
+            logger.error(f"Error streaming itinerary: {str(e)}")
+            yield _sse_event("error", {"detail": f"Internal server error: {str(e)}"})
+        finally:
+            # Client ngắt kết nối giữa chừng thì hủy luôn graph đang chạy
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Contract của endpoint cũ: chỉ các field công khai của state ban đầu. Các field khác của graph state
+# là nội bộ (prompt chứa toàn bộ context Wikivoyage + history nên rất lớn) và thay đổi theo workflow
+LEGACY_FIELDS = ("user_input", "itinerary", "output", "success", "ai_provider")
+
+def _legacy_fields(request: Request, data: dict) -> Optional[List[str]]:
+    """`fields` from the body (list or comma separated) or the query string, None if not given"""
+    fields = data.get("fields", request.query_params.get("fields"))
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    return [str(field).strip() for field in fields if str(field).strip()]
+
 @app.post("/generate-itinerary-legacy")
 async def generate_itinerary_legacy(request: Request):
-    """Legacy endpoint for backward compatibility"""
+    """Legacy endpoint for backward compatibility
+
+    Returns the legacy contract's fields of the graph state (`LEGACY_FIELDS`);
+    `fields` selects specific keys, `fields=*` returns the full state.
+    """
     try:
         data = await request.json()
         
-        result = compiled_graph.invoke({
+        result = await compiled_graph.ainvoke({
             "user_input": data.get("text", ""),
-            "ai_provider": data.get("ai_provider", "gpt")
+            "ai_provider": data.get("ai_provider", "gpt"),
+            "bypass_cache": bool(data.get("bypass_cache", False)),
+            "hedge": data.get("hedge")
         })
         
-        return result
+        # Trả thẳng response class để bỏ qua jsonable_encoder trên cả state
+        return JSONResponseClass(select_fields(result, _legacy_fields(request, data), LEGACY_FIELDS))
         
     except Exception as e:
         logger.error(f"Error in legacy endpoint: {str(e)}")
@@ -99,14 +358,26 @@ async def generate_itinerary_legacy(request: Request):
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
-    import os
-    
+    degraded = any(breaker.state != "closed" for breaker in breakers.values())
     health_status = {
-        "status": "healthy",
+        "status": "degraded" if degraded else "healthy",
         "services": {
             "langgraph": "connected",
-            "openai": "configured" if os.getenv("OPENAI_API_KEY") else "not_configured",
-            "gemini": "configured" if os.getenv("GEMINI_API_KEY") else "not_configured"
+            **{provider.name: "configured" if provider.configured else "not_configured" for provider in providers}
+        },
+        "providers": providers.stats(),
+        "startup": startup_report.as_dict(),
+        "cache": response_cache.stats(),
+        "route_cache": route_cache.stats(),
+        "singleflight": {
+            flight.name: flight.stats() for flight in (destination_flight, context_flight, llm_flight)
+        },
+        "breakers": {provider: breaker.stats() for provider, breaker in breakers.items()},
+        "hedging": {
+            "enabled": HEDGE_ENABLED,
+            **hedge_stats,
+            "delay_s": {provider: round(hedge_delay(provider), 3) for provider in ttft_windows},
+            "ttft": {provider: window.stats() for provider, window in ttft_windows.items()}
         }
     }
     
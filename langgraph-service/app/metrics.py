@@ -0,0 +1,159 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.startup import startup_report
+
+# Bucket (giây) đủ rộng cho cả bước local (ms) lẫn lời gọi LLM (hàng chục giây)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in sorted(self._values.items())]
+
+class Gauge(_Metric):
+    """Value read at scrape time from `collect`, which returns {label values tuple: value}"""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, help, labelnames)
+        self._collect = collect
+
+    def _samples(self) -> List[str]:
+        values = self._collect() if self._collect else {}
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in sorted(values.items())]
+
+class CollectedCounter(Gauge):
+    """Counter kept elsewhere (e.g. cache hit counts) and read at scrape time"""
+    type = "counter"
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # [count mỗi bucket..., +Inf, sum]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), series[:-1]):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4"  # Starlette tự thêm charset
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = (), collect=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames, collect))
+
+def collected_counter(name: str, help: str, labelnames: Sequence[str] = (), collect=None) -> CollectedCounter:
+    return REGISTRY.register(CollectedCounter(name, help, labelnames, collect))
+
+# Các metric dùng chung của service
+request_duration = histogram(
+    "travel_http_request_duration_seconds", "Time to serve an API request", ("method", "path", "status"))
+node_duration = histogram(
+    "travel_node_duration_seconds", "Time spent in each LangGraph node", ("node", "status"))
+step_duration = histogram(
+    "travel_step_duration_seconds", "Time spent in upstream steps inside nodes", ("step", "status"))
+provider_duration = histogram(
+    "travel_provider_duration_seconds", "LLM provider call latency", ("provider", "status"))
+provider_queue = histogram(
+    "travel_provider_queue_seconds", "Time waiting for a provider's local concurrency and rate limits", ("provider",))
+provider_tokens = counter(
+    "travel_provider_tokens_total", "Prompt and completion tokens sent to/received from providers", ("provider", "kind"))
+upstream_requests = counter(
+    "travel_upstream_requests_total", "Outbound HTTP requests by host and status code", ("host", "status"))
+upstream_duration = histogram(
+    "travel_upstream_response_seconds", "Outbound HTTP time to response headers", ("host",))
+startup_seconds = gauge(
+    "travel_startup_seconds", "Wall time of each startup phase of this worker", ("phase",),
+    collect=lambda: {(phase,): seconds for phase, seconds in startup_report.phases.items()})
@@ -0,0 +1,109 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.history import find_route_block, strip_route_block
+from app.prompts import EDIT, Messages, context_block
+
+# Dòng tiêu đề mở đầu một section: markdown heading, dòng in đậm, hoặc "Ngày N"/"Day N"
+_HEADING = re.compile(r"^\s*(#{1,6}\s|\*\*[^*\n]+\*\*:?\s*$|(\*\*)?\s*(ngày|day)\s*\d)", re.IGNORECASE)
+_DAY_NUMBER = re.compile(r"\d+")
+_FENCE = re.compile(r"```(json)?", re.IGNORECASE)
+
+# Các key của patch theo prompt EDIT (app/prompts.py); phải có ít nhất một thao tác
+PATCH_OPS = {"sections", "new_sections", "remove_sections", "route"}
+PATCH_KEYS = PATCH_OPS | {"note"}
+
+def split_sections(text: str) -> List[str]:
+    """Split an itinerary (without its route JSON) into heading-led sections"""
+    sections: List[List[str]] = []
+    for line in (text or "").splitlines():
+        if not sections or (_HEADING.match(line) and any(l.strip() for l in sections[-1])):
+            sections.append([])
+        sections[-1].append(line)
+    return [s for s in ("\n".join(lines).strip() for lines in sections) if s]
+
+def parse_route(text: str) -> Dict[str, list]:
+    block = find_route_block(text)
+    try:
+        route = json.loads(block).get("route") if block else None
+    except (json.JSONDecodeError, AttributeError):
+        route = None
+    return route if isinstance(route, dict) else {}
+
+def build_edit_prompt(previous: str, request: str, context: str = "", destination: str = "") -> Messages:
+    """Messages asking for a JSON patch against `previous` instead of a full itinerary"""
+    sections = "\n\n".join(f"[S{i}]\n{section}" for i, section in enumerate(split_sections(strip_route_block(previous)), 1))
+    route = json.dumps({"route": parse_route(previous)}, ensure_ascii=False)
+    return EDIT.render(context=context_block(destination, context), sections=sections, route=route, request=request)
+
+def parse_patch(text: str) -> Optional[Dict[str, Any]]:
+    """The JSON patch object in a model reply, None if the reply is not a patch.
+
+    A reply that is a whole itinerary (text plus its route block) is not a patch even
+    though its route block parses: only a one-line remark and code fences may surround the object.
+    """
+    if not text:
+        return None
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    outside = _FENCE.sub("", text[:start] + " " + text[end + 1:]).strip()
+    if "\n" in outside:
+        return None
+    try:
+        patch = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(patch, dict) or not patch.keys() & PATCH_OPS or not patch.keys() <= PATCH_KEYS:
+        return None
+    return patch
+
+def _valid_stop(stop) -> bool:
+    if not isinstance(stop, dict) or not stop.get("name"):
+        return False
+    try:
+        float(stop["latitude"]), float(stop["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return True
+
+def _day_order(day: str) -> Tuple[int, str]:
+    match = _DAY_NUMBER.search(day)
+    return (int(match.group()) if match else 1 << 30, day)
+
+def apply_patch(previous: str, patch: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Previous itinerary with the patch applied, in the same text + ```json route format.
+
+    Returns None when the patch is malformed so the caller can regenerate in full.
+    """
+    if not isinstance(patch, dict):
+        return None
+    replaced = patch.get("sections") or {}
+    added = patch.get("new_sections") or []
+    removed = set(patch.get("remove_sections") or [])
+    route_changes = patch.get("route") or {}
+    if not isinstance(replaced, dict) or not isinstance(added, list) or not isinstance(route_changes, dict):
+        return None
+
+    sections = []
+    for i, section in enumerate(split_sections(strip_route_block(previous)), 1):
+        section_id = f"S{i}"
+        if section_id in removed:
+            continue
+        new_text = replaced.get(section_id)
+        sections.append(new_text.strip() if isinstance(new_text, str) and new_text.strip() else section)
+    sections.extend(text.strip() for text in added if isinstance(text, str) and text.strip())
+
+    route = parse_route(previous)
+    for day, stops in route_changes.items():
+        if not isinstance(stops, list) or not all(_valid_stop(stop) for stop in stops):
+            return None
+        if stops:
+            route[day] = stops
+        else:
+            route.pop(day, None)
+    route = {day: route[day] for day in sorted(route, key=_day_order)}
+
+    route_json = json.dumps({"route": route}, ensure_ascii=False, indent=2)
+    return "\n\n".join(sections) + f"\n\n```json\n{route_json}\n```"
@@ -0,0 +1,174 @@
+import json
+import math
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app.gazetteer import Gazetteer, get_gazetteer, tokenize
+from app.road_graph import haversine_m
+
+DEFAULT_POI_PATH = os.path.join(os.path.dirname(__file__), "data", "vietnam_pois.json")
+
+# Khung tọa độ Việt Nam (kể cả biển đảo gần bờ); ngoài khung là tọa độ bịa hoặc đảo lat/lon
+VIETNAM_BOUNDS = (8.0, 23.5, 102.0, 110.0)
+# Bán kính hợp lý quanh tâm điểm đến, theo loại địa danh của điểm đến
+PLAUSIBLE_RADIUS_KM = {"attraction": 40, "city": 60, "province": 150, "region": 400}
+# Ô lưới ~1km cho tìm kiếm lân cận
+GRID_CELL_DEG = 0.01
+# Tên không khớp trie: tìm POI trong bán kính này có nhiều từ trùng tên
+FUZZY_RADIUS_M = 2000
+FUZZY_MIN_OVERLAP = 0.6
+_END = "\0"
+
+class POI(NamedTuple):
+    name: str
+    category: str
+    province: str
+    lat: float
+    lon: float
+    tokens: frozenset
+
+def in_vietnam(lat: float, lon: float) -> bool:
+    south, north, west, east = VIETNAM_BOUNDS
+    return south <= lat <= north and west <= lon <= east
+
+class POIIndex:
+    """Name trie plus a uniform grid over known places, for snapping LLM-generated stops.
+
+    A lookup walks the stop name once through the trie and scans a handful of
+    grid cells, so snapping a stop costs microseconds.
+    """
+
+    def __init__(self, pois: List[POI], aliases: List[Tuple[str, int]]):
+        self.pois = pois
+        self._trie: Dict[str, dict] = {}
+        for form, idx in aliases:
+            node = self._trie
+            for token in tokenize(form):
+                node = node.setdefault(token, {})
+            if node is not self._trie:
+                node.setdefault(_END, []).append(idx)
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        for idx, poi in enumerate(pois):
+            self._grid.setdefault(self._cell(poi.lat, poi.lon), []).append(idx)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_POI_PATH, gazetteer: Optional[Gazetteer] = None) -> "POIIndex":
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+        pois: List[POI] = []
+        aliases: List[Tuple[str, int]] = []
+
+        def add(name, category, province, lat, lon, forms):
+            idx = len(pois)
+            pois.append(POI(name, category, province, float(lat), float(lon), frozenset(tokenize(name))))
+            aliases.extend((form, idx) for form in (name, *forms))
+
+        for row in rows:
+            add(row["name"], row.get("category", "attraction"), row.get("province", ""),
+                row["lat"], row["lon"], row.get("aliases", []))
+        # Địa danh trong gazetteer (tỉnh, thành phố, điểm tham quan) cũng là POI hợp lệ
+        for place in (gazetteer.places if gazetteer else []):
+            add(place.name, place.type, place.province, place.lat, place.lon, place.aliases)
+        return cls(pois, aliases)
+
+    @staticmethod
+    def _cell(lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / GRID_CELL_DEG)), int(math.floor(lon / GRID_CELL_DEG))
+
+    def match_name(self, name: str) -> Tuple[List[int], bool]:
+        """POIs for the longest known name inside `name`, and whether it covers the whole name"""
+        tokens = tokenize(name)
+        best: Tuple[int, int, List[int]] = (0, 0, [])
+        for i in range(len(tokens)):
+            node = self._trie
+            j = i
+            while j < len(tokens) and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if _END in node and j - i > best[1] - best[0]:
+                    best = (i, j, node[_END])
+        start, end, candidates = best
+        return candidates, bool(candidates) and end - start == len(tokens)
+
+    def nearby(self, lat: float, lon: float, radius_m: float) -> List[Tuple[float, int]]:
+        """(distance, poi) pairs within `radius_m`, nearest first"""
+        row, col = self._cell(lat, lon)
+        cell_m = GRID_CELL_DEG * 111000 * max(math.cos(math.radians(lat)), 0.1)
+        rings = int(radius_m // cell_m) + 1
+        found = []
+        for r in range(row - rings, row + rings + 1):
+            for c in range(col - rings, col + rings + 1):
+                for idx in self._grid.get((r, c), ()):
+                    poi = self.pois[idx]
+                    dist = haversine_m(lat, lon, poi.lat, poi.lon)
+                    if dist <= radius_m:
+                        found.append((dist, idx))
+        return sorted(found)
+
+    def _fuzzy(self, name: str, lat: float, lon: float) -> Optional[int]:
+        tokens = set(tokenize(name))
+        if not tokens:
+            return None
+        for _, idx in self.nearby(lat, lon, FUZZY_RADIUS_M):
+            poi_tokens = self.pois[idx].tokens
+            if len(tokens & poi_tokens) / len(tokens | poi_tokens) >= FUZZY_MIN_OVERLAP:
+                return idx
+        return None
+
+    def snap_stop(self, stop: Dict[str, Any], centre: Optional[Tuple[float, float]] = None,
+                  radius_m: Optional[float] = None) -> Dict[str, Any]:
+        """Copy of a route stop with known-place coordinates and a `warning` for implausible ones.
+
+        A name that is exactly a known place is always snapped; a name that only
+        contains one (e.g. "Khách sạn gần Hồ Xuân Hương") is snapped only when the
+        generated point is implausible.
+        """
+        stop = dict(stop)
+        lat, lon = float(stop["latitude"]), float(stop["longitude"])
+        warning = None
+        if not in_vietnam(lat, lon) and in_vietnam(lon, lat):
+            lat, lon, warning = lon, lat, "latitude/longitude swapped"
+
+        def plausible(plat: float, plon: float) -> bool:
+            if not in_vietnam(plat, plon):
+                return False
+            return centre is None or radius_m is None or haversine_m(plat, plon, *centre) <= radius_m
+
+        generated_ok = plausible(lat, lon)
+        candidates, exact = self.match_name(stop.get("name", ""))
+        if candidates:
+            # Cùng tên ở nhiều nơi (vd. "Chợ đêm"): chọn nơi gần tọa độ sinh ra / tâm điểm đến nhất
+            ref = (lat, lon) if generated_ok or centre is None else centre
+            idx = min(candidates, key=lambda i: haversine_m(ref[0], ref[1], self.pois[i].lat, self.pois[i].lon))
+            if not plausible(self.pois[idx].lat, self.pois[idx].lon) and generated_ok:
+                idx = None
+        else:
+            idx = self._fuzzy(stop.get("name", ""), lat, lon) if generated_ok else None
+            exact = idx is not None
+
+        if idx is not None and (exact or not generated_ok):
+            poi = self.pois[idx]
+            lat, lon = poi.lat, poi.lon
+            stop["snapped_to"] = poi.name
+        elif not generated_ok:
+            warning = "coordinates implausible for this destination"
+        stop["latitude"], stop["longitude"] = lat, lon
+        if warning:
+            stop["warning"] = warning
+        return stop
+
+    def snap_route(self, route: Dict[str, List[Dict[str, Any]]], destination: Optional[str] = None,
+                   gazetteer: Optional[Gazetteer] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Snap every stop of every day; plausibility is judged around the destination's centroid"""
+        centre = radius_m = None
+        place = gazetteer.by_wikivoyage(destination) if gazetteer and destination else None
+        if place is not None:
+            centre = (place.lat, place.lon)
+            radius_m = PLAUSIBLE_RADIUS_KM.get(place.type, 150) * 1000
+        return {day: [self.snap_stop(stop, centre, radius_m) for stop in stops] for day, stops in route.items()}
+
+@lru_cache(maxsize=1)
+def get_poi_index() -> POIIndex:
+    """Process-wide POI index (bundled POIs + gazetteer places), loaded on first use"""
+    return POIIndex.load(os.getenv("POI_DATA_PATH", DEFAULT_POI_PATH), get_gazetteer())
@@ -0,0 +1,108 @@
+from functools import cached_property
+from string import Formatter
+from typing import Dict, List
+
+from app.tokens import count_tokens
+
+Messages = List[Dict[str, str]]
+
+class PromptTemplate:
+    """A fixed system message followed by a user message rendered from named fields.
+
+    Everything that never changes (instructions, output format, JSON schema) lives
+    in the system message so every request starts with the same prefix, which
+    provider-side prompt caching and local KV reuse can hit. The user template is
+    parsed once, when the module is imported.
+    """
+
+    def __init__(self, name: str, system: str, user: str):
+        self.name = name
+        self.system = system
+        self._segments = [(literal, field) for literal, field, _, _ in Formatter().parse(user)]
+        self.fields = tuple(field for _, field in self._segments if field)
+
+    @cached_property
+    def prefix_tokens(self) -> int:
+        return count_tokens(self.system)
+
+    def render(self, **values: str) -> Messages:
+        parts = []
+        for literal, field in self._segments:
+            parts.append(literal)
+            if field:
+                parts.append(str(values.get(field) or ""))
+        return [{"role": "system", "content": self.system}, {"role": "user", "content": "".join(parts)}]
+
+def flatten(messages: Messages) -> str:
+    """Single prompt text for providers without a system role, cache keys and logs"""
+    return "\n\n".join(message["content"] for message in messages if message.get("content"))
+
+# Prompt có thể chỉnh sửa output bằng cách thay đổi format dưới đây.
+# Không đưa dữ liệu thay đổi theo request vào phần system: mọi thứ biến đổi nằm trong tin nhắn user,
+# theo thứ tự ít thay đổi nhất trước (context của điểm đến, history, rồi yêu cầu mới).
+ITINERARY = PromptTemplate(
+    "itinerary",
+    system="""Bạn là một chuyên gia lập kế hoạch du lịch. Hãy tư vấn chi tiết lịch trình vui chơi, ăn uống, địa điểm du lịch, tổng chi tiêu (tóm lại là tư vấn du lịch chi tiết) cho hội thoại trong tin nhắn của người dùng. Tin nhắn có thể bắt đầu bằng context về điểm đến và phần hội thoại trước đó, dòng "Người dùng:" cuối cùng là yêu cầu mới.
+
+QUAN TRỌNG: Nếu đây là cuộc hội thoại tiếp theo (có history), bạn PHẢI:
+1. Giữ nguyên format và cấu trúc của lịch trình trước đó
+2. Chỉ điều chỉnh các thông tin cần thiết dựa trên yêu cầu mới
+3. KHÔNG tạo lại lịch trình mới từ đầu
+4. Giữ nguyên các địa điểm không liên quan đến yêu cầu mới
+
+Hãy bao gồm:
+- Lịch trình theo ngày
+- Địa điểm tham quan
+- Gợi ý ăn uống
+- Phương tiện di chuyển
+- Chi phí ước tính
+
+Cuối cùng, BẮT BUỘC phải thêm một block JSON ở cuối câu trả lời, đúng format sau (KHÔNG GIẢI THÍCH, KHÔNG ĐƯỢC BỎ QUA PHẦN NÀY):
+
+```json
+{
+  "route": {
+    "day1": [
+      {"name": "Điểm xuất phát", "latitude": 10.762622, "longitude": 106.660172, "time": "06:00"},
+      {"name": "Địa điểm 1", "latitude": 11.940419, "longitude": 108.458313, "time": "14:00"}
+    ],
+    "day2": [
+      {"name": "Địa điểm ngày 2", "latitude": 11.946463, "longitude": 108.441932, "time": "08:00"}
+    ],
+    "day3": [
+      {"name": "Địa điểm ngày 3", "latitude": 11.940419, "longitude": 108.458313, "time": "08:00"}
+    ]
+  }
+}
+```
+
+Chỉ cần trả về JSON cho các địa điểm chính, không cần mô tả chi tiết trong JSON.
+
+Lưu ý:
+1. Thêm điểm xuất phát cho mỗi ngày (ví dụ: khách sạn, nhà nghỉ)
+2. Đảm bảo các địa điểm được sắp xếp theo thứ tự thời gian
+3. Trả lời bằng tiếng Việt và KHÔNG hiển thị phần JSON trong phần trình bày phía trên, chỉ để ở cuối câu trả lời
+4. Nếu là cuộc hội thoại tiếp theo, PHẢI giữ nguyên format và chỉ điều chỉnh nội dung cần thiết""",
+    user="{context}{history}Người dùng: {user_input}",
+)
+
+EDIT = PromptTemplate(
+    "edit",
+    system="""Bạn là một chuyên gia lập kế hoạch du lịch. Tin nhắn của người dùng chứa lịch trình hiện tại, đã chia thành các section có mã [S1], [S2], ..., route JSON hiện tại và yêu cầu chỉnh sửa.
+
+Chỉ trả về MỘT object JSON (không giải thích, không markdown) mô tả PHẦN THAY ĐỔI, đúng format sau:
+{"sections": {"S2": "nội dung mới đầy đủ của section S2, gồm cả dòng tiêu đề"}, "new_sections": ["section mới thêm vào cuối"], "remove_sections": ["S5"], "route": {"day2": [{"name": "Địa điểm", "latitude": 11.94, "longitude": 108.45, "time": "08:00"}]}, "note": "mô tả ngắn thay đổi"}
+
+Quy tắc:
+1. Chỉ đưa vào các section và các ngày THỰC SỰ thay đổi; bỏ trống các trường không dùng
+2. Mỗi ngày trong "route" thay toàn bộ danh sách điểm của ngày đó; dùng [] để xóa một ngày
+3. Giữ nguyên format, văn phong và tiếng Việt của lịch trình hiện tại""",
+    user="{context}Lịch trình hiện tại:\n\n{sections}\n\nRoute JSON hiện tại:\n{route}\n\nYêu cầu chỉnh sửa của người dùng: {request}",
+)
+
+TEMPLATES = (ITINERARY, EDIT)
+
+def context_block(destination: str, context: str) -> str:
+    if not context:
+        return ""
+    return f"Context retrieved for {destination}:\n{context}\n\n"
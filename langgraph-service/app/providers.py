@@ -0,0 +1,360 @@
+import asyncio
+import contextlib
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from app.http_client import get_http_client, default_timeout
+from app.prompts import Messages, flatten
+from app.startup import lazy_import
+
+Emit = Optional[Callable[[str], None]]
+
+class Completion(NamedTuple):
+    text: str
+    # Token usage do provider trả về: prompt_tokens, completion_tokens, cached_tokens (có thể thiếu)
+    usage: Dict[str, int]
+
+def _field(obj, name: str):
+    """Attribute or dict key; fields newer than the installed SDK only exist as raw dicts"""
+    if obj is None:
+        return None
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+class ProviderAdapter:
+    """One upstream LLM API behind a provider name, with its model and generation settings"""
+
+    def __init__(self, name: str, model: str, temperature: float = 0.7, max_output_tokens: int = 2000):
+        self.name = name
+        self.model = model
+        self.temperature = temperature
+        self.max_output_tokens = max_output_tokens
+
+    @property
+    def configured(self) -> bool:
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """Import the SDK and build the client ahead of the first request (no network call)"""
+
+    def params(self) -> Dict[str, Any]:
+        """Settings that influence the answer, part of the response cache key"""
+        return {"model": self.model, "temperature": self.temperature, "max_tokens": self.max_output_tokens}
+
+    async def generate(self, messages: Messages, emit: Emit = None) -> Completion:
+        """Full answer and token usage; streams through `emit` token by token when it is set"""
+        raise NotImplementedError
+
+class OpenAIAdapter(ProviderAdapter):
+    """OpenAI-compatible chat completions (OpenAI, Monica.im, ...) on the shared HTTP pool.
+
+    The `openai` package is imported and the client built on first use.
+    """
+
+    def __init__(self, name: str, api_key: Optional[str], model: str, base_url: Optional[str] = None,
+                 stream_usage: bool = True, **settings):
+        super().__init__(name, model, **settings)
+        self.api_key = api_key
+        self.base_url = base_url
+        # Xin usage (kể cả cached tokens) ở chunk cuối của stream; tắt nếu gateway không nhận stream_options
+        self.stream_usage = stream_usage
+        self._client = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    @property
+    def client(self):
+        """AsyncOpenAI client, None when no API key is configured"""
+        if self._client is None and self.api_key:
+            openai = lazy_import("openai")
+            # Dùng chung connection pool với các request HTTP khác của service
+            self._client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=get_http_client(),
+                timeout=default_timeout()
+            )
+        return self._client
+
+    def warm_up(self) -> None:
+        self.client
+
+    @staticmethod
+    def _usage(usage) -> Dict[str, int]:
+        if usage is None:
+            return {}
+        result = {"prompt_tokens": _field(usage, "prompt_tokens"), "completion_tokens": _field(usage, "completion_tokens"),
+                  "cached_tokens": _field(_field(usage, "prompt_tokens_details"), "cached_tokens")}
+        return {key: value for key, value in result.items() if value is not None}
+
+    async def generate(self, messages: Messages, emit: Emit = None) -> Completion:
+        if self.client is None:
+            raise Exception("OpenAI client not initialized. Check your OPENAI_API_KEY.")
+        stream = emit is not None
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_output_tokens,
+            stream=stream,
+            # openai==1.12 chưa có tham số stream_options
+            extra_body={"stream_options": {"include_usage": True}} if stream and self.stream_usage else None
+        )
+        if not stream:
+            return Completion(response.choices[0].message.content, self._usage(response.usage))
+
+        parts = []
+        usage = {}
+        async for chunk in response:
+            if _field(chunk, "usage") is not None:
+                usage = self._usage(_field(chunk, "usage"))
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                parts.append(token)
+                emit(token)
+        return Completion("".join(parts), usage)
+
+def _gemini_text(data: Dict[str, Any]) -> str:
+    candidates = data.get("candidates") or [{}]
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+def _gemini_usage(data: Dict[str, Any]) -> Dict[str, int]:
+    metadata = data.get("usageMetadata") or {}
+    result = {"prompt_tokens": metadata.get("promptTokenCount"), "completion_tokens": metadata.get("candidatesTokenCount"),
+              "cached_tokens": metadata.get("cachedContentTokenCount")}
+    return {key: value for key, value in result.items() if value is not None}
+
+class GeminiAdapter(ProviderAdapter):
+    """Google Gemini through the SDK, or over REST on the shared HTTP pool when `base_url` is set.
+
+    The SDK is imported and the model built once, on first use.
+    """
+
+    def __init__(self, name: str, api_key: Optional[str], model: str, base_url: str = "", **settings):
+        super().__init__(name, model, **settings)
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self._model = None
+        self._config = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def _sdk_model(self):
+        if self._model is None:
+            genai = lazy_import("google.generativeai")
+            genai.configure(api_key=self.api_key)
+            self._config = genai.types.GenerationConfig(
+                temperature=self.temperature, max_output_tokens=self.max_output_tokens
+            )
+            self._model = genai.GenerativeModel(self.model)
+        return self._model
+
+    def warm_up(self) -> None:
+        if self.api_key and not self.base_url:
+            self._sdk_model()
+
+    async def generate(self, messages: Messages, emit: Emit = None) -> Completion:
+        if not self.api_key:
+            raise Exception("Gemini client not initialized. Check your GEMINI_API_KEY.")
+        # google-generativeai==0.3.1 chưa hỗ trợ system instruction: ghép thành một prompt,
+        # phần system vẫn đứng đầu nên prefix giữ nguyên giữa các request
+        prompt = flatten(messages)
+        if self.base_url:
+            return await self._generate_rest(prompt, emit)
+        model = self._sdk_model()
+        response = await model.generate_content_async(prompt, generation_config=self._config, stream=emit is not None)
+        if emit is None:
+            return Completion(response.text, {})
+
+        parts = []
+        async for chunk in response:
+            token = chunk.text
+            if token:
+                parts.append(token)
+                emit(token)
+        return Completion("".join(parts), {})
+
+    async def _generate_rest(self, prompt: str, emit: Emit) -> Completion:
+        method = "streamGenerateContent" if emit is not None else "generateContent"
+        url = f"{self.base_url}/v1beta/models/{self.model}:{method}"
+        params = {"key": self.api_key, **({"alt": "sse"} if emit is not None else {})}
+        body = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": self.temperature, "maxOutputTokens": self.max_output_tokens}
+        }
+        client = get_http_client()
+        if emit is None:
+            response = await client.post(url, params=params, json=body)
+            response.raise_for_status()
+            data = response.json()
+            return Completion(_gemini_text(data), _gemini_usage(data))
+
+        parts = []
+        usage = {}
+        async with client.stream("POST", url, params=params, json=body) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[5:])
+                usage = _gemini_usage(data) or usage
+                token = _gemini_text(data)
+                if token:
+                    parts.append(token)
+                    emit(token)
+        return Completion("".join(parts), usage)
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most one minute's worth; 0 disables it.
+
+    Waiters are served in arrival order, so callers queue locally instead of
+    being rejected upstream with 429.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.level + (now - self._updated) * self.capacity / 60, self.capacity)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1) -> float:
+        """Take `amount` units, sleeping until they are available; returns seconds waited"""
+        if self.capacity <= 0:
+            return 0.0
+        # Một request lớn hơn cả bucket vẫn được đi khi bucket đầy, thay vì chờ mãi
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            wait = max((amount - self.level) * 60 / self.capacity, 0.0)
+            if wait:
+                await asyncio.sleep(wait)
+                self._refill()
+            self.level -= amount
+            return wait
+
+    def refund(self, amount: float) -> None:
+        """Return units that were reserved but not used"""
+        if self.capacity > 0 and amount > 0:
+            self._refill()
+            self.level = min(self.level + amount, self.capacity)
+
+class Lease:
+    """A granted provider slot; report the tokens actually used so the unused reservation is refunded"""
+
+    def __init__(self, reserved_tokens: int, waited: float):
+        self.reserved_tokens = reserved_tokens
+        self.used_tokens = reserved_tokens
+        self.waited = waited
+
+    def used(self, tokens: int) -> None:
+        self.used_tokens = tokens
+
+class Provider:
+    """A registered adapter plus its local limits: max concurrent calls, requests/min and tokens/min"""
+
+    def __init__(self, adapter: ProviderAdapter, max_concurrency: int = 0,
+                 requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.adapter = adapter
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.in_flight = 0
+        self.queued = 0
+        self.calls = 0
+        self.waited_seconds = 0.0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    @property
+    def name(self) -> str:
+        return self.adapter.name
+
+    @property
+    def configured(self) -> bool:
+        return self.adapter.configured
+
+    @contextlib.asynccontextmanager
+    async def lease(self, prompt_tokens: int) -> AsyncIterator[Lease]:
+        """Wait for a concurrency slot, a request and prompt + max output tokens of budget"""
+        reserved = prompt_tokens + self.adapter.max_output_tokens
+        started = time.perf_counter()
+        self.queued += 1
+        try:
+            if self._slots is not None:
+                await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        try:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(reserved)
+            lease = Lease(reserved, time.perf_counter() - started)
+            self.waited_seconds += lease.waited
+            self.calls += 1
+            self.in_flight += 1
+            try:
+                yield lease
+            finally:
+                self.in_flight -= 1
+                self.tokens.refund(lease.reserved_tokens - lease.used_tokens)
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def record_usage(self, prompt_tokens: int, cached_tokens: int) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "configured": self.configured,
+            "model": self.adapter.model,
+            "max_concurrency": self.max_concurrency or None,
+            "requests_per_minute": self.requests.capacity or None,
+            "tokens_per_minute": self.tokens.capacity or None,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "calls": self.calls,
+            "queue_wait_s": round(self.waited_seconds, 3),
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cached_ratio": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else None,
+        }
+
+class ProviderRegistry:
+    """Providers by (lower-case) name, in registration order"""
+
+    def __init__(self):
+        self._providers: Dict[str, Provider] = {}
+
+    def register(self, adapter: ProviderAdapter, **limits) -> Provider:
+        provider = Provider(adapter, **limits)
+        self._providers[adapter.name.lower()] = provider
+        return provider
+
+    def get(self, name: Optional[str]) -> Optional[Provider]:
+        return self._providers.get((name or "").lower())
+
+    def __contains__(self, name: Optional[str]) -> bool:
+        return self.get(name) is not None
+
+    def __iter__(self) -> Iterator[Provider]:
+        return iter(self._providers.values())
+
+    def names(self) -> List[str]:
+        return list(self._providers)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: provider.stats() for name, provider in self._providers.items()}
@@ -0,0 +1,145 @@
+import gzip
+import json
+import zlib
+from typing import Any, Iterable, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# orjson là tùy chọn: không có thì dùng json của thư viện chuẩn
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Response class mặc định của app: orjson serialize nhanh hơn json.dumps vài lần
+JSONResponseClass = ORJSONResponse if orjson is not None else JSONResponse
+
+def dumps(data: Any) -> str:
+    """Compact JSON text (UTF-8 kept as is), used for SSE payloads"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+class CompressionMiddleware:
+    """Compress response bodies of at least `minimum_size` bytes with brotli (if installed) or gzip.
+
+    Follows the client's Accept-Encoding. Streams (e.g. server-sent events) are
+    left alone so tokens still reach the client as soon as they are produced.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4,
+                 exclude_types: Iterable[str] = ("text/event-stream",)):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.exclude_types = tuple(exclude_types)
+        self.brotli = _brotli()
+
+    def _encoding(self, scope: Scope) -> Optional[str]:
+        accepted = Headers(scope=scope).get("accept-encoding", "")
+        tokens = {part.split(";")[0].strip().lower() for part in accepted.split(",")}
+        if self.brotli is not None and "br" in tokens:
+            return "br"
+        if "gzip" in tokens:
+            return "gzip"
+        return None
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return self.brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = self._encoding(scope) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        passthrough = False
+        stream = None  # compressor khi body đến thành nhiều phần
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passthrough, stream
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = Headers(raw=start["headers"])
+                content_type = headers.get("content-type", "")
+                skip = ("content-encoding" in headers or content_type.startswith(self.exclude_types)
+                        or (not more_body and len(body) < self.minimum_size))
+                if skip:
+                    passthrough = True
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+
+                response_headers = MutableHeaders(raw=start["headers"])
+                response_headers["Content-Encoding"] = encoding
+                response_headers.add_vary_header("Accept-Encoding")
+                if not more_body:
+                    body = self.compress(body, encoding)
+                    response_headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    start = None
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                del response_headers["Content-Length"]
+                stream = _StreamCompressor(encoding, self)
+                await send(start)
+                start = None
+
+            chunk = stream.compress(body) + (b"" if more_body else stream.finish())
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+class _StreamCompressor:
+    """Incremental gzip/brotli for bodies sent in several parts"""
+
+    def __init__(self, encoding: str, middleware: CompressionMiddleware):
+        if encoding == "br":
+            self._brotli = middleware.brotli.Compressor(quality=middleware.brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(middleware.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+def select_fields(state: dict, fields: Optional[List[str]], default: Tuple[str, ...]) -> dict:
+    """Keep only `fields` of a graph state, the `default` keys when `fields` is None.
+
+    `fields=["*"]` returns the full state.
+    """
+    if fields is None:
+        fields = default
+    elif "*" in fields:
+        return dict(state)
+    return {key: state[key] for key in fields if key in state}
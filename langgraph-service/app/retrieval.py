@@ -0,0 +1,140 @@
+from collections import Counter
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from app.context_store import bm25_scores
+from app.gazetteer import tokenize
+from app.tokens import count_tokens
+
+# Một section dài được cắt thành nhiều chunk, mỗi chunk tối đa chừng này token
+CHUNK_MAX_TOKENS = 400
+
+# Wikivoyage viết bằng tiếng Anh còn người dùng hỏi bằng tiếng Việt: map các ý định
+# thường gặp (đã bỏ dấu) sang từ khóa tiếng Anh của các mục Wikivoyage.
+# Bỏ dấu làm các âm tiết đơn trùng nhau ("quán"/"Quận", "ăn"/"Hội An", "rẻ"/"rẽ"...) nên chỉ dùng
+# cụm nhiều âm tiết, khớp trọn token
+_INTENT_TERMS = {
+    "an uong": "eat food restaurant",
+    "do an": "eat food restaurant",
+    "mon an": "eat food dish",
+    "am thuc": "eat food cuisine",
+    "dac san": "eat food local specialty",
+    "quan an": "eat restaurant",
+    "nha hang": "eat restaurant",
+    "do uong": "drink cafe bar",
+    "ca phe": "drink coffee cafe",
+    "quan bar": "drink bar nightlife",
+    "khach san": "sleep hotel",
+    "nha nghi": "sleep guesthouse",
+    "cho o": "sleep hotel guesthouse",
+    "luu tru": "sleep hotel guesthouse",
+    "homestay": "sleep homestay guesthouse",
+    "tham quan": "see attraction",
+    "dia diem": "see attraction",
+    "vui choi": "do see activity",
+    "di chuyen": "get around transport",
+    "xe may": "get around motorbike",
+    "xe buyt": "get around bus",
+    "thue xe": "get around rental motorbike car",
+    "may bay": "get in airport flight",
+    "san bay": "get in airport flight",
+    "tau hoa": "get in train",
+    "tau lua": "get in train",
+    "mua sam": "buy market shopping",
+    "di cho": "buy market",
+    "cho dem": "buy market night",
+    "chi phi": "budget price cost",
+    "ngan sach": "budget price cost",
+    "gia ca": "price cost",
+    "gia re": "budget cheap",
+    "tiet kiem": "budget cheap",
+    "an toan": "stay safe",
+    "thoi tiet": "climate weather understand",
+    "khi hau": "climate weather understand",
+}
+# Prompt luôn yêu cầu lịch trình, ăn uống, di chuyển, chi phí nên query luôn có các mục này
+_BASE_QUERY = "understand see do eat get around sleep budget"
+
+class Chunk(NamedTuple):
+    position: int
+    heading: str
+    text: str
+    tokens: int
+
+def expand_query(text: str) -> str:
+    """Add English Wikivoyage terms for Vietnamese travel intents found in `text`"""
+    folded = f" {' '.join(tokenize(text))} "
+    extra = [terms for phrase, terms in _INTENT_TERMS.items() if f" {phrase} " in folded]
+    return " ".join([text, _BASE_QUERY, *extra])
+
+def _split_long_line(line: str, max_tokens: int) -> List[str]:
+    """Cut a paragraph that alone exceeds `max_tokens` into word-bounded pieces"""
+    if count_tokens(line) <= max_tokens:
+        return [line]
+    pieces, words, size = [], [], 0
+    for word in line.split(" "):
+        word_tokens = count_tokens(" " + word)
+        if words and size + word_tokens > max_tokens:
+            pieces.append(" ".join(words))
+            words, size = [], 0
+        words.append(word)
+        size += word_tokens
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+def chunk_sections(sections: Sequence[Tuple[str, str]], max_tokens: int = CHUNK_MAX_TOKENS) -> List[Chunk]:
+    """Split (heading, text) sections into chunks of at most `max_tokens`, on line boundaries"""
+    chunks: List[Chunk] = []
+    for heading, text in sections:
+        lines, size = [], 0
+        lines_in = [piece for line in text.split("\n") for piece in _split_long_line(line, max_tokens)]
+        for line in lines_in:
+            line_tokens = count_tokens(line)
+            if lines and size + line_tokens > max_tokens:
+                body = "\n".join(lines)
+                chunks.append(Chunk(len(chunks), heading, body, count_tokens(body)))
+                lines, size = [], 0
+            lines.append(line)
+            size += line_tokens
+        if lines:
+            body = "\n".join(lines)
+            chunks.append(Chunk(len(chunks), heading, body, count_tokens(body)))
+    return chunks
+
+def select_chunks(chunks: Sequence[Chunk], query: str, token_budget: int, top_k: int) -> List[Chunk]:
+    """Highest BM25-scoring chunks for `query` that fit in `token_budget`, in article order"""
+    if not chunks or token_budget <= 0 or top_k <= 0:
+        return []
+
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    lengths: Dict[int, int] = {}
+    for chunk in chunks:
+        terms = Counter(tokenize(f"{chunk.heading} {chunk.text}"))
+        lengths[chunk.position] = sum(terms.values())
+        for term, tf in terms.items():
+            postings.setdefault(term, []).append((chunk.position, tf))
+    avg_length = sum(lengths.values()) / len(lengths)
+    scores = bm25_scores(tokenize(query), postings, lengths, len(chunks), avg_length)
+
+    # Điểm bằng nhau thì ưu tiên chunk đứng trước (phần giới thiệu của bài)
+    ranked = sorted(chunks, key=lambda chunk: (-scores.get(chunk.position, 0.0), chunk.position))
+    selected, used = [], 0
+    for chunk in ranked:
+        if len(selected) >= top_k:
+            break
+        if used + chunk.tokens > token_budget:
+            continue
+        selected.append(chunk)
+        used += chunk.tokens
+    return sorted(selected, key=lambda chunk: chunk.position)
+
+def history_query(user_input: str, history: list, turns: int = 3) -> str:
+    """Current request plus the last few user turns, used to score context chunks"""
+    parts = [user_input]
+    if isinstance(history, list):
+        recent = [m.get("content", "") for m in history if isinstance(m, dict) and m.get("role", "user") == "user"]
+        parts.extend(recent[-turns:])
+    return " ".join(part for part in parts if part)
+
+def render_chunks(chunks: Sequence[Chunk]) -> str:
+    return "\n\n".join(f"{chunk.heading}:\n{chunk.text}" for chunk in chunks)
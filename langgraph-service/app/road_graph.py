@@ -0,0 +1,227 @@
+import heapq
+import math
+import os
+import struct
+import sys
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from app.startup import lazy_import
+
+DEFAULT_GRAPH_PATH = ".cache/vietnam_roads.graph"
+
+_MAGIC = b"VRG1"
+_HEADER = struct.Struct("<4s?QQ")  # magic, little endian, số node, số cạnh
+EARTH_RADIUS_M = 6371008.8
+
+# Tốc độ trung bình (km/h) theo loại đường OSM, dùng làm trọng số thời gian đi
+HIGHWAY_SPEEDS_KMH = {
+    "motorway": 90, "motorway_link": 50,
+    "trunk": 70, "trunk_link": 40,
+    "primary": 60, "primary_link": 35,
+    "secondary": 50, "secondary_link": 30,
+    "tertiary": 40, "tertiary_link": 25,
+    "unclassified": 30, "road": 30,
+    "residential": 25, "living_street": 10,
+    "service": 15, "track": 15,
+}
+MAX_SPEED_MPS = max(HIGHWAY_SPEEDS_KMH.values()) / 3.6
+
+# Lưới không gian để snap tọa độ vào node gần nhất: ô 0.005 độ (~500m)
+GRID_CELL_DEG = 0.005
+SNAP_MAX_RINGS = 10
+
+# Số node tối đa A* được settle cho một chặng trước khi bỏ cuộc: giới hạn thời gian CPU
+# (và thời gian giữ GIL) của một request; chặng vượt quá thì dùng fallback của route handler
+ROAD_GRAPH_MAX_SETTLED = int(os.getenv("ROAD_GRAPH_MAX_SETTLED", 500_000))
+
+def _cell_key(row, col):
+    """Single int64 key of a grid cell (works on ints and numpy arrays); |col| < 2**19 covers every longitude"""
+    return row * (1 << 20) + (col + (1 << 19))
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+def write_graph(path: str, lats, lons, sources, targets, weights) -> Dict[str, int]:
+    """Sort directed edges (sources[i] -> targets[i], weights[i] seconds) into CSR arrays and write them to `path`.
+
+    Every argument is an array-like (typed `array` or numpy), never a list of Python tuples.
+    """
+    np = lazy_import("numpy")
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int32)
+    weights = np.asarray(weights, dtype=np.float32)
+    order = np.lexsort((weights, targets, sources))
+    n_nodes, n_edges = len(lats), len(order)
+    offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n_nodes), out=offsets[1:])
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, sys.byteorder == "little", n_nodes, n_edges))
+        for arr in (lats, lons, offsets, targets[order], weights[order]):
+            arr.tofile(f)
+    os.replace(path + ".tmp", path)
+    return {"nodes": n_nodes, "edges": n_edges}
+
+class RoadGraph:
+    """Road network as CSR arrays: node coordinates, edge offsets, targets and travel seconds"""
+
+    def __init__(self, lats: array, lons: array, offsets: array, targets: array, weights: array):
+        self.lats = lats
+        self.lons = lons
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        # Lưới snap dạng CSR: node routable (có cạnh đi ra) sắp theo key của ô,
+        # `_cell_keys` là các key khác nhau và `_cell_offsets` chỉ ra đoạn node của từng ô
+        np = lazy_import("numpy")
+        node_offsets = np.frombuffer(offsets, dtype=np.int64)
+        routable = np.flatnonzero(node_offsets[1:] > node_offsets[:-1])
+        keys = _cell_key(np.floor(np.frombuffer(lats, dtype=np.float64)[routable] / GRID_CELL_DEG).astype(np.int64),
+                         np.floor(np.frombuffer(lons, dtype=np.float64)[routable] / GRID_CELL_DEG).astype(np.int64))
+        order = np.argsort(keys, kind="stable")
+        self._cell_nodes = routable[order]
+        self._cell_keys, starts = np.unique(keys[order], return_index=True)
+        self._cell_offsets = np.append(starts, len(order))
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        with open(path, "rb") as f:
+            magic, little, n_nodes, n_edges = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not a road graph file")
+            arrays = []
+            for typecode, count in (("d", n_nodes), ("d", n_nodes), ("q", n_nodes + 1), ("i", n_edges), ("f", n_edges)):
+                arr = array(typecode)
+                arr.fromfile(f, count)
+                if little != (sys.byteorder == "little"):
+                    arr.byteswap()
+                arrays.append(arr)
+        return cls(*arrays)
+
+    @staticmethod
+    def _cell(lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / GRID_CELL_DEG)), int(math.floor(lon / GRID_CELL_DEG))
+
+    def _cell_members(self, row: int, col: int) -> List[int]:
+        key = _cell_key(row, col)
+        i = int(self._cell_keys.searchsorted(key))
+        if i == len(self._cell_keys) or self._cell_keys[i] != key:
+            return []
+        return self._cell_nodes[self._cell_offsets[i]:self._cell_offsets[i + 1]].tolist()
+
+    def nearest_node(self, lat: float, lon: float) -> Optional[int]:
+        """Closest routable node, searching outward ring by ring (None if nothing within ~5km)"""
+        row, col = self._cell(lat, lon)
+        # Khoảng cách (m) tối thiểu tới một ô cách đây `ring` ô (theo chiều kinh độ, ngắn hơn)
+        cell_m = GRID_CELL_DEG * 111000 * math.cos(math.radians(lat))
+        best, best_dist = None, math.inf
+        for ring in range(SNAP_MAX_RINGS + 1):
+            for r in range(row - ring, row + ring + 1):
+                for c in range(col - ring, col + ring + 1):
+                    if max(abs(r - row), abs(c - col)) != ring:
+                        continue
+                    for node in self._cell_members(r, c):
+                        dist = haversine_m(lat, lon, self.lats[node], self.lons[node])
+                        if dist < best_dist:
+                            best, best_dist = node, dist
+            # Ô ở vòng kế tiếp cách ít nhất `ring` ô nên có thể dừng sớm
+            if best is not None and best_dist < ring * cell_m:
+                break
+        return best
+
+    def shortest_path(self, source: int, target: int, max_settled: int = ROAD_GRAPH_MAX_SETTLED) -> Optional[Tuple[List[int], float]]:
+        """A* on travel time with a straight-line/top-speed heuristic; (nodes, seconds) or None"""
+        lats, lons = self.lats, self.lons
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        target_lat, target_lon = lats[target], lons[target]
+
+        def heuristic(node: int) -> float:
+            return haversine_m(lats[node], lons[node], target_lat, target_lon) / MAX_SPEED_MPS
+
+        best = {source: 0.0}
+        previous: Dict[int, int] = {}
+        settled = set()
+        heap = [(heuristic(source), 0.0, source)]
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                path = [node]
+                while node in previous:
+                    node = previous[node]
+                    path.append(node)
+                return path[::-1], cost
+            if node in settled:
+                continue
+            settled.add(node)
+            if len(settled) > max_settled:
+                return None
+            for i in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[i]
+                new_cost = cost + weights[i]
+                if new_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = new_cost
+                    previous[neighbour] = node
+                    heapq.heappush(heap, (new_cost + heuristic(neighbour), new_cost, neighbour))
+        return None
+
+    def route_geojson(self, coordinates: List[List[float]]) -> Optional[dict]:
+        """Route through [lng, lat] waypoints, in the same GeoJSON shape as OpenRouteService"""
+        nodes = [self.nearest_node(lat, lng) for lng, lat in coordinates]
+        if any(node is None for node in nodes):
+            return None
+
+        line: List[List[float]] = []
+        duration = 0.0
+        for source, target in zip(nodes, nodes[1:]):
+            if source == target:
+                continue
+            result = self.shortest_path(source, target)
+            if result is None:
+                return None
+            path, seconds = result
+            duration += seconds
+            if line:
+                path = path[1:]
+            line.extend([self.lons[node], self.lats[node]] for node in path)
+        if len(line) < 2:
+            line = [list(point) for point in coordinates]
+
+        distance = sum(haversine_m(a[1], a[0], b[1], b[0]) for a, b in zip(line, line[1:]))
+        return {
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "properties": {
+                    "engine": "local",
+                    "summary": {"distance": round(distance, 1), "duration": round(duration, 1)}
+                },
+                "geometry": {
+                    "type": "LineString",
+                    "coordinates": line
+                }
+            }]
+        }
+
+_graph: Optional[RoadGraph] = None
+_graph_lock = threading.Lock()
+
+def get_road_graph() -> Optional[RoadGraph]:
+    """Process-wide road graph, None until `python -m app.build_road_graph` has been run"""
+    global _graph
+    if _graph is not None:
+        return _graph
+    path = os.getenv("ROAD_GRAPH_PATH", DEFAULT_GRAPH_PATH)
+    if not path or not os.path.exists(path):
+        return None
+    with _graph_lock:
+        if _graph is None:
+            _graph = RoadGraph.load(path)
+    return _graph
@@ -0,0 +1,98 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from app.cache import ResponseCache, make_cache_key
+from app.history import find_route_block, strip_route_block
+
+# Re-ask bằng JSON mode khi block route trong câu trả lời bị thiếu/hỏng; giới hạn số lần
+ROUTE_REASK_MODEL = "gpt-4o-mini"
+ROUTE_REASK_ATTEMPTS = int(os.getenv("ROUTE_REASK_ATTEMPTS", 1))
+
+_DAY_KEY = re.compile(r"^day\d+$")
+
+class RouteStop(BaseModel):
+    name: str = Field(min_length=1)
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+    time: Optional[str] = None
+    snapped_to: Optional[str] = None  # Tên địa danh đã biết mà tọa độ được snap vào
+    warning: Optional[str] = None  # Tọa độ đáng ngờ so với điểm đến
+
+class RoutePayload(BaseModel):
+    route: Dict[str, List[RouteStop]]
+
+    @field_validator("route")
+    @classmethod
+    def check_days(cls, route: Dict[str, List[RouteStop]]) -> Dict[str, List[RouteStop]]:
+        if not route:
+            raise ValueError("route has no days")
+        for day, stops in route.items():
+            if not _DAY_KEY.match(day):
+                raise ValueError(f"day keys must look like 'day1', got '{day}'")
+            if not stops:
+                raise ValueError(f"{day} has no stops")
+        return route
+
+def validate_route(raw: str) -> Tuple[Optional[Dict[str, List[Dict[str, Any]]]], Optional[str]]:
+    """(route, None) for valid route JSON text, else (None, reason)"""
+    try:
+        payload = RoutePayload.model_validate_json(raw)
+    except ValidationError as e:
+        return None, "; ".join(f"{'.'.join(map(str, err['loc'])) or 'json'}: {err['msg']}" for err in e.errors()[:5])
+    return payload.model_dump(exclude_none=True)["route"], None
+
+def validate_route_block(itinerary: str) -> Tuple[Optional[Dict[str, List[Dict[str, Any]]]], Optional[str]]:
+    """Validated route from the itinerary's own JSON block, or (None, why it was rejected)"""
+    block = find_route_block(itinerary)
+    if block is None:
+        return None, "no route JSON block"
+    return validate_route(block)
+
+async def _reask(itinerary: str, error: str, complete) -> Tuple[Optional[Dict[str, List[Dict[str, Any]]]], Optional[str]]:
+    content = await complete(
+        [
+            {"role": "system", "content": (
+                'Extract the travel route from the itinerary as JSON: {"route": {"day1": '
+                '[{"name": str, "latitude": float, "longitude": float, "time": "HH:MM"}], ...}}. '
+                "Keep the place names in Vietnamese, in visiting order."
+            )},
+            {"role": "user", "content": f"{itinerary}\n\nPrevious route JSON was rejected: {error}"}
+        ],
+        model=ROUTE_REASK_MODEL,
+        response_format={"type": "json_object"},
+        temperature=0
+    )
+    return validate_route(content or "")
+
+async def extract_route(itinerary: str, complete, cache: ResponseCache) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """Validated route for an itinerary: its own JSON block, else a bounded, cached JSON-mode re-ask.
+
+    `complete(messages, **params)` returns a chat completion's text (None disables the re-ask).
+    """
+    route, error = validate_route_block(itinerary)
+    if route is not None or complete is None or ROUTE_REASK_ATTEMPTS <= 0 or not itinerary:
+        return route
+
+    text = strip_route_block(itinerary)
+    key = make_cache_key(text, "route-extract", {"model": ROUTE_REASK_MODEL})
+    cached = await cache.aget(key)
+    if cached is not None:
+        # {} = lần trước re-ask cũng thất bại, không hỏi lại
+        return cached or None
+
+    try:
+        for _ in range(ROUTE_REASK_ATTEMPTS):
+            route, error = await _reask(text, error, complete)
+            if route is not None:
+                break
+    except Exception as e:
+        # Lỗi mạng thì không cache, lần sau còn thử lại
+        print(f"Route re-ask failed: {str(e)}")
+        return None
+    if route is None:
+        print(f"Route JSON still invalid after re-ask: {error}")
+    await cache.aset(key, route or {})
+    return route
@@ -0,0 +1,120 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.road_graph import EARTH_RADIUS_M
+
+# Một điểm có giờ (vd. bữa trưa 12:00) chỉ được dời tới khung giờ lệch tối đa chừng này phút
+TIME_WINDOW_SLACK_MIN = 90
+_TIME = re.compile(r"^\s*(\d{1,2})[:h](\d{2})?")
+
+def haversine_matrix(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Pairwise great-circle distances in metres, computed in one vectorized pass"""
+    lat = np.radians(lats)[:, None]
+    lon = np.radians(lons)[:, None]
+    dlat = lat - lat.T
+    dlon = lon - lon.T
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def parse_minutes(value) -> Optional[int]:
+    """"08:30" / "8h30" -> minutes after midnight, None if absent or unparseable"""
+    match = _TIME.match(value) if isinstance(value, str) else None
+    if not match:
+        return None
+    return int(match.group(1)) * 60 + int(match.group(2) or 0)
+
+def path_length(dist: np.ndarray, order: List[int]) -> float:
+    return float(dist[order[:-1], order[1:]].sum()) if len(order) > 1 else 0.0
+
+def _feasible(order: List[int], windows: List[Optional[int]], slots: List[Optional[int]], slack: int) -> bool:
+    """Stop `order[p]` takes the time slot of position p; it must stay within `slack` of its own time"""
+    for position, stop in enumerate(order):
+        if windows[stop] is not None and slots[position] is not None and abs(slots[position] - windows[stop]) > slack:
+            return False
+    return True
+
+def _nearest_neighbour(dist: np.ndarray) -> List[int]:
+    order, visited = [0], np.zeros(len(dist), dtype=bool)
+    visited[0] = True
+    for _ in range(len(dist) - 1):
+        row = np.where(visited, np.inf, dist[order[-1]])
+        nxt = int(row.argmin())
+        order.append(nxt)
+        visited[nxt] = True
+    return order
+
+def _two_opt(dist: np.ndarray, order: List[int], windows, slots, slack: int) -> List[int]:
+    """2-opt on an open path with position 0 fixed, only accepting feasible improvements"""
+    n = len(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            for k in range(i + 1, n):
+                a, b, c = order[i - 1], order[i], order[k]
+                delta = dist[a, c] - dist[a, b]
+                if k + 1 < n:
+                    e = order[k + 1]
+                    delta += dist[b, e] - dist[c, e]
+                if delta < -1e-6:
+                    candidate = order[:i] + order[i:k + 1][::-1] + order[k + 1:]
+                    if _feasible(candidate, windows, slots, slack):
+                        order, improved = candidate, True
+    return order
+
+def optimize_day(stops: List[Dict[str, Any]], slack: int = TIME_WINDOW_SLACK_MIN) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Reorder one day's stops (first stop fixed as the start); returns (stops, report).
+
+    Stops keep the day's original sequence of time slots, so a reordered stop
+    takes the time of the position it moves to, within its time window.
+    """
+    before_order = list(range(len(stops)))
+    dist = haversine_matrix(
+        np.array([s["latitude"] for s in stops], dtype=float),
+        np.array([s["longitude"] for s in stops], dtype=float),
+    )
+    before = path_length(dist, before_order)
+    if len(stops) < 3:
+        return stops, {"before_km": round(before / 1000, 2), "after_km": round(before / 1000, 2),
+                       "saved_km": 0.0, "reordered": False}
+
+    windows = [parse_minutes(s.get("time")) for s in stops]
+    slots = list(windows)
+
+    candidates = [_two_opt(dist, before_order, windows, slots, slack)]
+    greedy = _nearest_neighbour(dist)
+    if _feasible(greedy, windows, slots, slack):
+        candidates.append(_two_opt(dist, greedy, windows, slots, slack))
+    best = min(candidates, key=lambda order: path_length(dist, order))
+
+    after = path_length(dist, best)
+    reordered = best != before_order and after < before - 1
+    if not reordered:
+        best, after = before_order, before
+    result = []
+    for position, index in enumerate(best):
+        stop = dict(stops[index])
+        if reordered and "time" in stops[position]:
+            stop["time"] = stops[position]["time"]
+        result.append(stop)
+    return result, {
+        "before_km": round(before / 1000, 2),
+        "after_km": round(after / 1000, 2),
+        "saved_km": round((before - after) / 1000, 2),
+        "reordered": reordered,
+    }
+
+def optimize_route(route: Dict[str, List[Dict[str, Any]]]) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Any]]:
+    """Optimize every day; the report has per-day and total distances in km"""
+    optimized, days = {}, {}
+    for day, stops in route.items():
+        optimized[day], days[day] = optimize_day(stops)
+    report = {
+        "days": days,
+        "before_km": round(sum(d["before_km"] for d in days.values()), 2),
+        "after_km": round(sum(d["after_km"] for d in days.values()), 2),
+        "saved_km": round(sum(d["saved_km"] for d in days.values()), 2),
+    }
+    return optimized, report
@@ -1,41 +1,158 @@
 from fastapi import APIRouter, Request, HTTPException
-import requests
+import asyncio
+import hashlib
+import httpx
+import json
 import os
+from app.cache import ResponseCache
+from app.http_client import get_http_client
+from app.road_graph import get_road_graph
+
+OPENROUTE_TIMEOUT = float(os.getenv("OPENROUTE_TIMEOUT", 10))
+OPENROUTE_PROFILE = "driving-car"
+OPENROUTE_BASE_URL = os.getenv("OPENROUTE_BASE_URL", "https://api.openrouteservice.org").rstrip("/")
+
+# "ors": OpenRouteService trước, road graph offline làm fallback
+# "local": road graph offline trước, OpenRouteService chỉ khi không tìm được đường
+ROUTING_ENGINE = os.getenv("ROUTING_ENGINE", "ors").lower()
+
+# Giới hạn công việc routing của một request (OpenRouteService cũng giới hạn số waypoint)
+ROUTE_MAX_STOPS = int(os.getenv("ROUTE_MAX_STOPS", 50))
+ROUTE_BATCH_MAX_DAYS = int(os.getenv("ROUTE_BATCH_MAX_DAYS", 31))
+# A* thuần Python giữ GIL: chạy quá nhiều cùng lúc trong thread pool vẫn làm event loop chậm theo
+ROAD_GRAPH_MAX_CONCURRENCY = int(os.getenv("ROAD_GRAPH_MAX_CONCURRENCY", 2))
+_local_route_slots = asyncio.Semaphore(ROAD_GRAPH_MAX_CONCURRENCY)
+
+# Làm tròn tọa độ trước khi tạo cache key: 5 chữ số thập phân ~ 1m
+ROUTE_CACHE_PRECISION = int(os.getenv("ROUTE_CACHE_PRECISION", 5))
+route_cache = ResponseCache(
+    path=os.getenv("ROUTE_CACHE_PATH", ".cache/routes.sqlite3") or None,
+    max_entries=int(os.getenv("ROUTE_CACHE_MEMORY_SIZE", 512)),
+    disk_max_entries=int(os.getenv("ROUTE_CACHE_DISK_SIZE", 20000)),
+    ttl_seconds=float(os.getenv("ROUTE_CACHE_TTL", 30 * 24 * 3600)),
+    table="routes",
+)
 
 router = APIRouter()
 
-@router.post('/api/route')
-async def get_route(request: Request):
-    body = await request.json()
-    coordinates = body.get('coordinates')
+def route_cache_key(coordinates: list, precision: int = ROUTE_CACHE_PRECISION) -> str:
+    """Hash of the coordinate sequence rounded to `precision` decimals"""
+    rounded = [[round(float(lng), precision), round(float(lat), precision)] for lng, lat in coordinates]
+    payload = json.dumps({"profile": OPENROUTE_PROFILE, "coordinates": rounded}, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def straight_line_route(coordinates: list) -> dict:
+    """Fallback: a simple straight line through the coordinates"""
+    return {
+        "type": "FeatureCollection",
+        "features": [{
+            "type": "Feature",
+            "properties": {},
+            "geometry": {
+                "type": "LineString",
+                "coordinates": coordinates
+            }
+        }]
+    }
+
+def _validate_coordinates(coordinates) -> list:
     if not coordinates or len(coordinates) < 2:
         raise HTTPException(status_code=400, detail="Need at least 2 coordinates")
-    
+    if len(coordinates) > ROUTE_MAX_STOPS:
+        raise HTTPException(status_code=400, detail=f"At most {ROUTE_MAX_STOPS} coordinates per route")
+    try:
+        return [[float(point[0]), float(point[1])] for point in coordinates]
+    except (TypeError, ValueError, IndexError):
+        raise HTTPException(status_code=400, detail="Coordinates must be [longitude, latitude] pairs")
+
+async def _local_route(coordinates: list):
+    """Route on the offline road graph, None if it is not built or has no path"""
+    # Lần đầu get_road_graph đọc cả file graph và dựng lưới snap: chạy trong thread (có lock) để không chặn event loop
+    graph = await asyncio.to_thread(get_road_graph)
+    if graph is None:
+        return None
+    # A* thuần Python tốn CPU, không chạy trên event loop
+    async with _local_route_slots:
+        return await asyncio.to_thread(graph.route_geojson, coordinates)
+
+async def resolve_route(coordinates: list) -> dict:
+    """GeoJSON route for [lng, lat] coordinates: route cache, then the configured routing engines"""
+    coordinates = _validate_coordinates(coordinates)
+    key = route_cache_key(coordinates)
+    cached = await route_cache.aget(key)
+    if cached is not None:
+        return cached
+
+    if ROUTING_ENGINE == "local":
+        data = await _local_route(coordinates)
+        if data is not None:
+            await route_cache.aset(key, data)
+            return data
+
     api_key = os.getenv('VITE_OPENROUTE_API_KEY')
     if not api_key:
+        data = await _local_route(coordinates) if ROUTING_ENGINE != "local" else None
+        if data is not None:
+            await route_cache.aset(key, data)
+            return data
         raise HTTPException(status_code=500, detail="OPENROUTE_API_KEY not set")
-    
-    url = 'https://api.openrouteservice.org/v2/directions/driving-car/geojson'
+
+    url = f'{OPENROUTE_BASE_URL}/v2/directions/{OPENROUTE_PROFILE}/geojson'
     headers = {
         'Authorization': f'Bearer {api_key}',
         'Content-Type': 'application/json'
     }
-    
+
     try:
-        resp = requests.post(url, headers=headers, json={'coordinates': coordinates}, timeout=10)
+        resp = await get_http_client().post(
+            url, headers=headers, json={'coordinates': coordinates}, timeout=OPENROUTE_TIMEOUT
+        )
         resp.raise_for_status()
-        return resp.json()
-    except requests.RequestException as e:
-        # Fallback: return a simple straight line route if OpenRouteService fails
+        data = resp.json()
+    except httpx.HTTPError as e:
+        # Fallback không được cache để lần sau còn thử lại OpenRouteService
         print(f"OpenRouteService failed: {e}")
-        return {
-            "type": "FeatureCollection",
-            "features": [{
-                "type": "Feature",
-                "properties": {},
-                "geometry": {
-                    "type": "LineString",
-                    "coordinates": coordinates
-                }
-            }]
-        }
\ No newline at end of file
+        data = await _local_route(coordinates) if ROUTING_ENGINE != "local" else None
+        return data if data is not None else straight_line_route(coordinates)
+
+    await route_cache.aset(key, data)
+    return data
+
+@router.post('/api/route')
+async def get_route(request: Request):
+    body = await request.json()
+    return await resolve_route(body.get('coordinates'))
+
+@router.post('/api/routes/batch')
+async def get_routes_batch(request: Request):
+    """Resolve every day's route of an itinerary in one request
+
+    Body: {"routes": {"day1": [[lng, lat], ...], "day2": [...]}}
+    Returns {"routes": {"day1": <GeoJSON>, ...}, "errors": {"dayN": "..."}}.
+    """
+    body = await request.json()
+    routes = body.get('routes')
+    if not isinstance(routes, dict) or not routes:
+        raise HTTPException(status_code=400, detail="'routes' must be a non-empty object of coordinate lists")
+    if len(routes) > ROUTE_BATCH_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"At most {ROUTE_BATCH_MAX_DAYS} days per batch")
+    oversized = [day for day, coordinates in routes.items()
+                 if isinstance(coordinates, list) and len(coordinates) > ROUTE_MAX_STOPS]
+    if oversized:
+        raise HTTPException(status_code=400, detail=f"At most {ROUTE_MAX_STOPS} coordinates per route ({', '.join(oversized)})")
+
+    days = list(routes.keys())
+    results = await asyncio.gather(
+        *(resolve_route(routes[day]) for day in days),
+        return_exceptions=True
+    )
+
+    resolved, errors = {}, {}
+    for day, result in zip(days, results):
+        if isinstance(result, HTTPException):
+            errors[day] = result.detail
+        elif isinstance(result, Exception):
+            errors[day] = str(result)
+        else:
+            resolved[day] = result
+    return {"routes": resolved, "errors": errors}
@@ -0,0 +1,50 @@
+import contextlib
+import importlib
+import os
+import sys
+import time
+from datetime import datetime
+from types import ModuleType
+from typing import Any, Dict, Iterator
+
+class StartupReport:
+    """Wall time of each startup phase (imports, graph compilation, warm-up, lazy imports)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.phases: Dict[str, float] = {}
+
+    def record(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def mark(self, phase: str) -> None:
+        """Record the time elapsed since the report was created (e.g. `imports`, `ready`)"""
+        self.phases[phase] = time.perf_counter() - self.started
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "started_at": self.started_at,
+            "pid": os.getpid(),
+            "python": sys.version.split()[0],
+            "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()},
+        }
+
+# app.main import module này trước mọi import nặng để `imports` đo được chi phí import của service
+startup_report = StartupReport()
+
+def lazy_import(name: str) -> ModuleType:
+    """Import a heavy optional library on first use, recording the cost as `import:<name>`"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with startup_report.phase(f"import:{name}"):
+        return importlib.import_module(name)
@@ -1,219 +1,735 @@
-from openai import OpenAI
-import google.generativeai as genai
+import asyncio
+import contextvars
 import os
-from typing import Dict, Any
-import requests
-from bs4 import BeautifulSoup
-from googlesearch import search
+import time
+from typing import Callable, Dict, Any, List, Optional, Tuple
 import re
+from app.cache import ResponseCache, make_cache_key, normalize_text
+from app.http_client import get_http_client
+from app.gazetteer import get_gazetteer
+from app.context_store import get_context_store
+from app.ingest_wikivoyage import html_sections
+from app.tokens import count_tokens
+from app.patching import build_edit_prompt, parse_patch, apply_patch
+from app.route_extraction import extract_route
+from app.poi_index import get_poi_index
+from app.metrics import step_duration, provider_duration, provider_queue, provider_tokens
+from app.retrieval import chunk_sections, select_chunks, expand_query, history_query, render_chunks
+from app.singleflight import SingleFlight
+from app.latency import LatencyWindow
+from app.breaker import CircuitBreaker, CircuitOpenError
+from app.providers import ProviderRegistry, OpenAIAdapter, GeminiAdapter
+from app.startup import lazy_import, startup_report
+from app.prompts import ITINERARY, TEMPLATES, Messages, context_block, flatten
+from app.history import (
+    split_history, render_turns, latest_route_block, history_chain_keys, extractive_summary,
+    truncate_tokens, latest_itinerary
+)
 
-# Initialize AI clients with error handling
-try:
-    # Support for Monica.im or standard OpenAI
-    openai_base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    
-    if openai_api_key:
-        openai_client = OpenAI(
-            api_key=openai_api_key,
-            base_url=openai_base_url
-        )
-        print(f"✅ OpenAI client initialized with base_url: {openai_base_url}")
-    else:
-        openai_client = None
-        print("⚠️ OPENAI_API_KEY not found, OpenAI client not initialized")
-        
-except Exception as e:
-    print(f"❌ Error initializing OpenAI client: {e}")
-    openai_client = None
-
-# Initialize Gemini
-try:
-    gemini_api_key = os.getenv("GEMINI_API_KEY")
-    if gemini_api_key:
-        genai.configure(api_key=gemini_api_key)
-        print("✅ Gemini client initialized")
-    else:
-        print("⚠️ GEMINI_API_KEY not found, Gemini client not initialized")
-except Exception as e:
-    print(f"❌ Error initializing Gemini client: {e}")
+GPT_MODEL = "gpt-4o"
+HELPER_MODEL = "gpt-4o-mini"  # Các lời gọi phụ: điểm đến, tóm tắt history, trích route
+GEMINI_MODEL = "gemini-pro"
+TEMPERATURE = 0.7
+MAX_OUTPUT_TOKENS = 2000
 
-def extract_destination(input_text: str, client) -> str:
-    """Extract destination from input text using OpenAI."""
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": f"Extract the destination from the following text: {input_text}, The result must be a Vietnamese place name written as a single word without accents"}
-        ]
+# Client của các provider được tạo khi dùng lần đầu (hoặc lúc warm-up): import openai/google.generativeai
+# tốn gần một giây nên không làm ở thời điểm import module.
+# Support for Monica.im or standard OpenAI
+openai_base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+openai_api_key = os.getenv("OPENAI_API_KEY")
+if openai_api_key:
+    print(f"✅ OpenAI configured with base_url: {openai_base_url}")
+else:
+    print("⚠️ OPENAI_API_KEY not found, OpenAI client not initialized")
+
+# Đặt GEMINI_BASE_URL để gọi REST API của Gemini qua connection pool chung
+# (proxy/gateway, hoặc stub trong bench/) thay vì gRPC của SDK
+gemini_base_url = os.getenv("GEMINI_BASE_URL", "").rstrip("/")
+gemini_api_key = os.getenv("GEMINI_API_KEY")
+if gemini_api_key:
+    print("✅ Gemini configured")
+else:
+    print("⚠️ GEMINI_API_KEY not found, Gemini client not initialized")
+
+# Provider đăng ký theo tên; mỗi provider có giới hạn riêng để xếp hàng tại chỗ thay vì ăn 429:
+# <NAME>_MAX_CONCURRENCY (lời gọi đồng thời), <NAME>_RPM (request/phút), <NAME>_TPM (token/phút), 0 = không giới hạn
+def _provider_limits(name: str) -> Dict[str, float]:
+    prefix = name.upper()
+    return {
+        "max_concurrency": int(os.getenv(f"{prefix}_MAX_CONCURRENCY", 16)),
+        "requests_per_minute": float(os.getenv(f"{prefix}_RPM", 0)),
+        "tokens_per_minute": float(os.getenv(f"{prefix}_TPM", 0)),
+    }
+
+openai_adapter = OpenAIAdapter(
+    "gpt", openai_api_key, GPT_MODEL, base_url=openai_base_url,
+    stream_usage=os.getenv("OPENAI_STREAM_USAGE", "true").lower() in ("1", "true", "yes"),
+    temperature=TEMPERATURE, max_output_tokens=MAX_OUTPUT_TOKENS
+)
+providers = ProviderRegistry()
+for _adapter in (
+    openai_adapter,
+    GeminiAdapter("gemini", gemini_api_key, GEMINI_MODEL, base_url=gemini_base_url,
+                  temperature=TEMPERATURE, max_output_tokens=MAX_OUTPUT_TOKENS),
+):
+    providers.register(_adapter, **_provider_limits(_adapter.name))
+
+def warm_up() -> None:
+    """Load the local indexes, the tokenizer and configured provider SDKs (blocking, no network calls)"""
+    with startup_report.phase("warmup:indexes"):
+        get_gazetteer()
+        get_poi_index()
+        get_context_store()
+    if ROUTE_OPTIMIZE_ENABLED:
+        lazy_import("app.route_optimizer")
+    with startup_report.phase("warmup:prompts"):
+        for template in TEMPLATES:
+            template.prefix_tokens
+    for provider in providers:
+        if not provider.configured:
+            continue
+        with startup_report.phase(f"warmup:{provider.name}"):
+            try:
+                provider.adapter.warm_up()
+            except Exception as e:
+                print(f"❌ Error warming up {provider.name}: {e}")
+
+# Đặt để lấy bài Wikivoyage trực tiếp (vd. https://en.wikivoyage.org) thay vì tìm qua Google
+WIKIVOYAGE_BASE_URL = os.getenv("WIKIVOYAGE_BASE_URL", "").rstrip("/")
+
+# Ngân sách cho phần context Wikivoyage đưa vào prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+CONTEXT_TOP_K = int(os.getenv("CONTEXT_TOP_K", 6))
+
+# Cache câu trả lời của CallAI: LRU trong RAM + SQLite để giữ qua các lần restart.
+# Đặt RESPONSE_CACHE_PATH="" để chỉ dùng cache trong RAM.
+response_cache = ResponseCache(
+    path=os.getenv("RESPONSE_CACHE_PATH", ".cache/responses.sqlite3") or None,
+    max_entries=int(os.getenv("RESPONSE_CACHE_MEMORY_SIZE", 256)),
+    disk_max_entries=int(os.getenv("RESPONSE_CACHE_DISK_SIZE", 5000)),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", 24 * 3600)),
+)
+
+# History chat: giữ nguyên các lượt gần nhất trong HISTORY_TOKEN_BUDGET token, các lượt cũ hơn
+# được thay bằng bản tóm tắt (gpt-4o-mini, tạo nền và cache theo prefix hội thoại)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 1500))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", 300))
+summary_cache = ResponseCache(
+    path=os.getenv("RESPONSE_CACHE_PATH", ".cache/responses.sqlite3") or None,
+    max_entries=int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", 256)),
+    disk_max_entries=int(os.getenv("RESPONSE_CACHE_DISK_SIZE", 5000)),
+    ttl_seconds=float(os.getenv("HISTORY_SUMMARY_TTL", 7 * 24 * 3600)),
+    table="history_summaries",
+)
+
+# Edit mode: câu hỏi tiếp theo trả về patch JSON áp lên lịch trình trước thay vì sinh lại toàn bộ
+EDIT_MODE_ENABLED = os.getenv("EDIT_MODE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Snap tọa độ các điểm dừng (do LLM tự bịa) vào địa danh đã biết trong app/data/vietnam_pois.json
+SNAP_ROUTE_ENABLED = os.getenv("SNAP_ROUTE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Sắp xếp lại thứ tự điểm dừng trong từng ngày cho quãng đường ngắn nhất (opt-in)
+ROUTE_OPTIMIZE_ENABLED = os.getenv("ROUTE_OPTIMIZE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Warm-up lúc khởi động: nạp index cục bộ, tokenizer và SDK của provider trước request đầu tiên
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Gộp các lời gọi upstream giống hệt nhau đang chạy đồng thời (cùng key) thành một
+destination_flight = SingleFlight("extract_destination")
+context_flight = SingleFlight("retrieve_context")
+llm_flight = SingleFlight("call_ai")
+summary_flight = SingleFlight("history_summary")
+
+# Hedging (opt-in): nếu provider chính chưa trả token đầu tiên sau một khoảng trễ
+# bằng percentile TTFT (time-to-first-token) quan sát được, gửi cùng prompt sang
+# provider còn lại; câu trả lời hoàn chỉnh đến trước thắng, bên kia bị hủy.
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", 5))  # giây, khi chưa đủ mẫu
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.5))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", 30))
+ttft_windows = {name: LatencyWindow() for name in providers.names()}
+hedge_stats = {"hedged": 0, "primary_wins": 0, "secondary_wins": 0}
+
+# Circuit breaker cho từng provider: mở khi tỉ lệ lỗi trong cửa sổ gần nhất vượt ngưỡng,
+# khi đó request được chuyển sang provider còn lại. Timeout mỗi lần gọi = p99 latency x hệ số.
+def _make_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        window=int(os.getenv("BREAKER_WINDOW", 50)),
+        min_calls=int(os.getenv("BREAKER_MIN_CALLS", 10)),
+        failure_rate=float(os.getenv("BREAKER_FAILURE_RATE", 0.5)),
+        open_seconds=float(os.getenv("BREAKER_OPEN_SECONDS", 30)),
+        default_timeout=float(os.getenv("PROVIDER_TIMEOUT_DEFAULT", 60)),
+        min_timeout=float(os.getenv("PROVIDER_TIMEOUT_MIN", 10)),
+        max_timeout=float(os.getenv("PROVIDER_TIMEOUT_MAX", 120)),
+        timeout_multiplier=float(os.getenv("PROVIDER_TIMEOUT_MULTIPLIER", 2)),
     )
-    return response.choices[0].message.content
 
-def retrieve_context(destination: str) -> str:
-    """Search and retrieve context from Wikivoyage."""
+breakers = {name: _make_breaker(name) for name in providers.names()}
+
+# Task chạy nền (lưu DB, ghi cache) sau khi đã trả response
+_background_tasks: set = set()
+
+# Hàng đợi nhận token khi client yêu cầu streaming (SSE). Endpoint streaming set
+# biến này trước khi chạy graph; các node kế thừa context nên provider adapter
+# biết phải stream và đẩy từng token vào đây. None = chế độ bình thường.
+token_sink: contextvars.ContextVar[Optional[asyncio.Queue]] = contextvars.ContextVar("token_sink", default=None)
+
+def match_destination(input_text: str, history: list = None) -> Optional[str]:
+    """Resolve the destination locally with the bundled gazetteer (no network)"""
+    gazetteer = get_gazetteer()
+    place = gazetteer.match(input_text)
+    # Câu hỏi tiếp theo thường không nhắc lại địa danh, thử các tin nhắn trước đó
+    if place is None and isinstance(history, list):
+        for msg in reversed(history):
+            if isinstance(msg, dict) and msg.get("role", "user") == "user":
+                place = gazetteer.match(msg.get("content", ""))
+                if place is not None:
+                    break
+    return place.wikivoyage if place else None
+
+async def extract_destination(input_text: str) -> str:
+    """Extract destination from input text using OpenAI."""
+    return await helper_completion([
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": f"Extract the destination from the following text: {input_text}, The result must be a Vietnamese place name written as a single word without accents"}
+    ])
+
+async def _retrieve_live_context(destination: str) -> List[Tuple[str, str]]:
+    """Search and retrieve context from the live Wikivoyage site."""
     try:
-        query = f"{destination} site:wikivoyage.org"
-        urls = list(search(query, num_results=1, stop=1))
+        if WIKIVOYAGE_BASE_URL:
+            # URL bài viết đoán được từ tên bài, không cần tìm qua Google
+            urls = [f"{WIKIVOYAGE_BASE_URL}/wiki/{destination.replace(' ', '_')}"]
+        else:
+            query = f"{destination} site:wikivoyage.org"
+            # googlesearch chỉ có API đồng bộ nên chạy trong thread pool
+            search = lazy_import("googlesearch").search
+            urls = await asyncio.to_thread(lambda: list(search(query, num_results=1, stop=1)))
         if not urls:
-            return ""
+            return []
         
         url = urls[0]
-        response = requests.get(url)
+        response = await get_http_client().get(url)
         if response.status_code != 200:
-            return ""
-            
-        soup = BeautifulSoup(response.text, 'html.parser')
-        content_div = soup.find('div', id='mw-content-text', class_='mw-body-content')
-        if not content_div:
-            return ""
+            return []
             
-        return content_div.get_text(strip=True)
+        # Parsing a full article is CPU bound, keep it off the event loop
+        _, sections = await asyncio.to_thread(html_sections, response.text)
+        return sections
     except Exception as e:
         print(f"Error retrieving context: {str(e)}")
-        return ""
+        return []
 
-def rag_retrieve_context(state: Dict[str, Any]) -> Dict[str, Any]:
-    """RAG step: extract destination, retrieve context, and add to prompt."""
+async def retrieve_context(destination: str) -> List[Tuple[str, str]]:
+    """Retrieve Wikivoyage context, from the offline store once it has been built."""
+    store = get_context_store()
+    if store is None:
+        # Chưa chạy `python -m app.ingest_wikivoyage` thì vẫn dùng Google + Wikivoyage online
+        return await _retrieve_live_context(destination)
+    try:
+        sections = await asyncio.to_thread(store.destination_sections, destination)
+    except Exception as e:
+        print(f"Error retrieving context: {str(e)}")
+        return []
+    return [(section.heading, section.text) for section in sections]
+
+async def _timed_step(step: str, coro):
+    started = time.perf_counter()
+    status = "error"
+    try:
+        result = await coro
+        status = "ok"
+        return result
+    finally:
+        step_duration.observe(time.perf_counter() - started, step=step, status=status)
+
+async def rag_retrieve_context(state: Dict[str, Any]) -> Dict[str, Any]:
+    """RAG step: extract destination and retrieve context for the prompt.
+
+    Runs in parallel with preprocess_input, so it only returns the keys it owns;
+    call_ai joins the context onto the prompt. A failure here is recorded in
+    `errors` and the itinerary is generated without context.
+    """
     user_input = state.get("user_input", "")
     if not user_input:
-        return state
-    destination = extract_destination(user_input, openai_client)
-    context = retrieve_context(destination)
-    prompt = state.get("prompt", "")
-    if context:
-        prompt += f"\n\nContext retrieved for {destination}:\n{context}"
-    return {**state, "prompt": prompt}
-
-def preprocess_input(state: Dict[str, Any]) -> Dict[str, Any]:
+        return {}
+    try:
+        return await _retrieve_rag_context(state, user_input)
+    except Exception as e:
+        print(f"Error in RAG step: {str(e)}")
+        return {"errors": [f"RAGRetrieveContext: {str(e)}"]}
+
+async def _retrieve_rag_context(state: Dict[str, Any], user_input: str) -> Dict[str, Any]:
+    destination = match_destination(user_input, state.get("history"))
+    if destination is None and _provider_available("gpt"):
+        # Chỉ gọi LLM khi gazetteer không nhận ra địa danh nào
+        destination, _ = await destination_flight.do(
+            normalize_text(user_input), lambda: _timed_step("extract_destination", extract_destination(user_input))
+        )
+    if not destination:
+        return {}
+    sections, _ = await context_flight.do(
+        normalize_text(destination), lambda: _timed_step("retrieve_context", retrieve_context(destination))
+    )
+
+    # Chỉ đưa vào prompt các chunk liên quan nhất, vừa đủ ngân sách token
+    token_budget = state.get("context_token_budget") or CONTEXT_TOKEN_BUDGET
+    top_k = state.get("context_top_k") or CONTEXT_TOP_K
+    query = expand_query(history_query(user_input, state.get("history")))
+    chunks = select_chunks(chunk_sections(sections), query, token_budget, top_k)
+    return {
+        "context": render_chunks(chunks),
+        "destination": destination,
+        "context_token_budget": token_budget,
+        "context_chunks": len(chunks),
+        "context_tokens": sum(chunk.tokens for chunk in chunks)
+    }
+
+async def _summarize_history(key: str, previous: str, messages: List[Dict[str, str]]) -> str:
+    """Fold older turns into the rolling summary with gpt-4o-mini and cache it under `key`; errors are logged, not raised"""
+    conversation = render_turns(messages)
+    prompt = [
+        {"role": "system", "content": "You summarize travel planning conversations."},
+        {"role": "user", "content": (
+            f"Tóm tắt ngắn gọn (tối đa {HISTORY_SUMMARY_TOKENS // 2} từ, tiếng Việt) cuộc hội thoại lập kế hoạch du lịch. "
+            "Giữ điểm đến, số ngày, ngân sách, số người, sở thích và các thay đổi đã thống nhất.\n\n"
+            f"Tóm tắt trước đó: {previous or '(không có)'}\n\nHội thoại tiếp theo:\n{conversation}"
+        )}
+    ]
+    try:
+        summary = truncate_tokens(await helper_completion(prompt), HISTORY_SUMMARY_TOKENS)
+    except Exception as e:
+        print(f"Error summarizing history: {str(e)}")
+        return ""
+    await summary_cache.aset(key, summary)
+    return summary
+
+async def _history_summary(older: List[Dict[str, str]]) -> str:
+    """Rolling summary of `older`: cached LLM summary, else a local one while it is built in the background"""
+    keys = history_chain_keys(older)
+    previous, covered = "", 0
+    for i in range(len(keys) - 1, -1, -1):
+        cached = await summary_cache.aget(keys[i])
+        if cached is not None:
+            previous, covered = cached, i + 1
+            break
+    if covered == len(older):
+        return previous
+
+    remaining = older[covered:]
+    if _provider_available("gpt"):
+        # Không chặn request hiện tại; lượt sau sẽ dùng bản tóm tắt đã cache
+        spawn_background(summary_flight.do(keys[-1], lambda: _summarize_history(keys[-1], previous, remaining)))
+    local = extractive_summary(remaining, HISTORY_SUMMARY_TOKENS - count_tokens(previous))
+    return " ".join(part for part in (previous, local) if part)
+
+async def compact_history(history) -> str:
+    """History block for the prompt: rolling summary + recent turns verbatim + latest route JSON"""
+    older, recent = split_history(history, HISTORY_TOKEN_BUDGET)
+    history_text = ""
+    if older:
+        summary = await _history_summary(older)
+        if summary:
+            history_text += f"Tóm tắt hội thoại trước đó: {summary}\n"
+    history_text += render_turns(recent)
+    # Route JSON của lịch trình gần nhất luôn được giữ để model chỉnh sửa tiếp
+    route_block = latest_route_block(history)
+    if route_block:
+        history_text += f"Bot (route JSON của lịch trình hiện tại):\n```json\n{route_block}\n```\n"
+    return history_text
+
+async def preprocess_input(state: Dict[str, Any]) -> Dict[str, Any]:
     """Preprocess user input and prepare prompt, hỗ trợ truyền history chat"""
-    user_input = state.get("user_input", "")
     ai_provider = state.get("ai_provider", "gpt")  
     history = state.get("history", [])
 
-    # Format lại history thành đoạn hội thoại
-    history_text = ""
-    if history and isinstance(history, list):
-        for msg in history:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            if role == "user":
-                history_text += f"Người dùng: {content}\n"
-            else:
-                history_text += f"Bot: {content}\n"
+    # Format lại history thành đoạn hội thoại, giới hạn theo token để prompt không phình mãi
+    history_text = await compact_history(history)
     
-    # Prompt có thể chỉnh sửa output bằng cách thay đổi format dưới đây
-    prompt = f"""Bạn là một chuyên gia lập kế hoạch du lịch. Hãy tư vấn chi tiết lịch trình vui chơi, ăn uống, địa điểm du lịch, tổng chi tiêu (tóm lại là tư vấn du lịch chi tiết) cho hội thoại sau:
-
-{history_text}Người dùng: {user_input}
-
-QUAN TRỌNG: Nếu đây là cuộc hội thoại tiếp theo (có history), bạn PHẢI:
-1. Giữ nguyên format và cấu trúc của lịch trình trước đó
-2. Chỉ điều chỉnh các thông tin cần thiết dựa trên yêu cầu mới
-3. KHÔNG tạo lại lịch trình mới từ đầu
-4. Giữ nguyên các địa điểm không liên quan đến yêu cầu mới
-
-Hãy bao gồm:
-- Lịch trình theo ngày
-- Địa điểm tham quan
-- Gợi ý ăn uống
-- Phương tiện di chuyển
-- Chi phí ước tính
-
-Cuối cùng, BẮT BUỘC phải thêm một block JSON ở cuối câu trả lời, đúng format sau (KHÔNG GIẢI THÍCH, KHÔNG ĐƯỢC BỎ QUA PHẦN NÀY):
-
-```json
-{{
-  "route": {{
-    "day1": [
-      {{"name": "Điểm xuất phát", "latitude": 10.762622, "longitude": 106.660172, "time": "06:00"}},
-      {{"name": "Địa điểm 1", "latitude": 11.940419, "longitude": 108.458313, "time": "14:00"}}
-    ],
-    "day2": [
-      {{"name": "Địa điểm ngày 2", "latitude": 11.946463, "longitude": 108.441932, "time": "08:00"}}
-    ],
-    "day3": [
-      {{"name": "Địa điểm ngày 3", "latitude": 11.940419, "longitude": 108.458313, "time": "08:00"}}
-    ]
-  }}
-}}
-```
+    # Prompt được dựng ở CallAI từ template (app/prompts.py), khi đã có context RAG
+    result = {"history_text": history_text}
+    edit_mode = state.get("edit_mode")
+    if EDIT_MODE_ENABLED if edit_mode is None else edit_mode:
+        # Có lịch trình trước đó (kèm route JSON) thì CallAI chỉ yêu cầu patch
+        previous = latest_itinerary(history)
+        if previous:
+            result["edit_base"] = previous
+    return result
 
-Chỉ cần trả về JSON cho các địa điểm chính, không cần mô tả chi tiết trong JSON.
+def compose_messages(state: Dict[str, Any]) -> Messages:
+    """System prefix + user message (RAG context, history, request) from the itinerary template"""
+    return ITINERARY.render(
+        context=context_block(state.get("destination") or "", state.get("context") or ""),
+        history=state.get("history_text") or "",
+        user_input=state.get("user_input", "")
+    )
 
-Lưu ý:
-1. Thêm điểm xuất phát cho mỗi ngày (ví dụ: khách sạn, nhà nghỉ)
-2. Đảm bảo các địa điểm được sắp xếp theo thứ tự thời gian
-3. Trả lời bằng tiếng Việt và KHÔNG hiển thị phần JSON trong phần trình bày phía trên, chỉ để ở cuối câu trả lời
-4. Nếu là cuộc hội thoại tiếp theo, PHẢI giữ nguyên format và chỉ điều chỉnh nội dung cần thiết"""
-    
+def _model_params(ai_provider: str) -> Dict[str, Any]:
+    """Model settings that influence the answer, part of the response cache key"""
+    provider = providers.get(ai_provider)
+    if provider is None:
+        return {"model": None, "temperature": TEMPERATURE, "max_tokens": MAX_OUTPUT_TOKENS}
+    return provider.adapter.params()
+
+async def _edit_itinerary(state: Dict[str, Any], previous: str, ai_provider: str) -> Optional[Dict[str, Any]]:
+    """Edit mode: ask for a JSON patch and apply it to the previous itinerary, None if unusable"""
+    messages = build_edit_prompt(previous, state.get("user_input", ""), state.get("context") or "",
+                                 state.get("destination") or "")
+    prompt = flatten(messages)
+    key = make_cache_key(prompt, ai_provider, {**_model_params(ai_provider), "mode": "edit"})
+    itinerary = None if state.get("bypass_cache", False) else await response_cache.aget(key)
+    cache_hit = itinerary is not None
+    if itinerary is None:
+        # Patch JSON không stream cho client; chỉ đẩy lịch trình đã ghép xong
+        sink_token = token_sink.set(None)
+        try:
+            (patch_text, served_by), _ = await llm_flight.do(key, lambda: _single_call(ai_provider, messages))
+        finally:
+            token_sink.reset(sink_token)
+        itinerary = apply_patch(previous, parse_patch(patch_text))
+        if itinerary is None:
+            print("Edit patch could not be applied, regenerating the full itinerary")
+            return None
+        if served_by == ai_provider:
+            spawn_background(response_cache.aset(key, itinerary))
+    else:
+        # Chỉ câu trả lời của chính provider được yêu cầu mới được ghi vào cache
+        served_by = ai_provider
+
+    sink = token_sink.get()
+    if sink is not None:
+        sink.put_nowait(itinerary)
     return {
-        **state,
-        "prompt": prompt
+        "prompt": prompt,
+        "itinerary": itinerary,
+        "served_by": served_by,
+        "cache_hit": cache_hit,
+        "edit_applied": True
     }
 
-def call_ai(state: Dict[str, Any]) -> Dict[str, Any]:
+async def call_ai(state: Dict[str, Any]) -> Dict[str, Any]:
     """Call AI service based on provider"""
-    prompt = state.get("prompt", "")
-    ai_provider = state.get("ai_provider", "gpt")
-    
+    messages = compose_messages(state)
+    prompt = flatten(messages)
+    ai_provider = (state.get("ai_provider") or "gpt").lower()
+
+    # Edit mode: chỉ sinh phần thay đổi, lỗi thì quay về sinh lại toàn bộ
+    edit_base = state.get("edit_base")
+    if edit_base and ai_provider in providers:
+        try:
+            edited = await _edit_itinerary(state, edit_base, ai_provider)
+        except Exception as e:
+            print(f"Edit mode failed, regenerating the full itinerary: {str(e)}")
+            edited = None
+        if edited is not None:
+            return edited
+
+    # bypass_cache bỏ qua bước đọc cache nhưng vẫn ghi đè kết quả mới
+    key = make_cache_key(prompt, ai_provider, _model_params(ai_provider))
+    if not state.get("bypass_cache", False):
+        cached = await response_cache.aget(key)
+        if cached is not None:
+            sink = token_sink.get()
+            if sink is not None:
+                sink.put_nowait(cached)
+            # Entry chỉ được ghi khi provider được yêu cầu tự trả lời (không failover/hedge)
+            return {
+                "prompt": prompt,
+                "itinerary": cached,
+                "served_by": ai_provider,
+                "cache_hit": True
+            }
+
+    if ai_provider not in providers:
+        message = f"Unsupported AI provider. Please use one of: {', '.join(providers.names())}."
+        return {
+            "prompt": prompt,
+            "itinerary": message,
+            "cache_hit": False,
+            "success": False,
+            "errors": [f"CallAI: {message}"]
+        }
+
     try:
-        if ai_provider.lower() == "gpt":
-            if openai_client is None:
-                raise Exception("OpenAI client not initialized. Check your OPENAI_API_KEY.")
-            response = call_gpt(prompt)
-        elif ai_provider.lower() == "gemini":
-            response = call_gemini(prompt)
-        else:
-            response = "Unsupported AI provider. Please use 'gpt' or 'gemini'."
-        
+        # Request giống hệt đang chờ provider thì đợi chung kết quả thay vì gọi lại
+        hedge = state.get("hedge")
+        hedge = HEDGE_ENABLED if hedge is None else hedge
+        # Request không hedge không được đi ké một lời gọi đang hedge (và ngược lại)
+        (response, served_by), shared = await llm_flight.do(
+            f"{key}:hedge" if hedge else key, lambda: _hedged_call(ai_provider, messages) if hedge else _single_call(ai_provider, messages)
+        )
+        if shared:
+            # Token chỉ được stream cho request dẫn đầu; request đi ké nhận cả đoạn một lần
+            sink = token_sink.get()
+            if sink is not None and response:
+                sink.put_nowait(response)
+            return {
+                "prompt": prompt,
+                "itinerary": response,
+                "served_by": served_by,
+                "cache_hit": False
+            }
+
+        if response and served_by == ai_provider:
+            # Ghi cache (có thể chạm đĩa) không cần chặn response. Câu trả lời từ provider khác
+            # (failover khi breaker mở, hedge thắng) không được cache dưới key của provider được yêu cầu
+            spawn_background(response_cache.aset(key, response))
         return {
-            **state,
-            "itinerary": response
+            "prompt": prompt,
+            "itinerary": response,
+            "served_by": served_by,
+            "cache_hit": False
         }
     except Exception as e:
         return {
-            **state,
-            "itinerary": f"Error calling AI service: {str(e)}"
+            "prompt": prompt,
+            "itinerary": f"Error calling AI service: {str(e)}",
+            "cache_hit": False,
+            "success": False,
+            "errors": [f"CallAI: {str(e)}"]
         }
 
-def call_gpt(prompt: str) -> str:
-    """Call OpenAI GPT API (supports Monica.im)"""
-    if openai_client is None:
-        raise Exception("OpenAI client not available")
-        
-    response = openai_client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.7,
-        max_tokens=2000
-    )
-    return response.choices[0].message.content
-
-def call_gemini(prompt: str) -> str:
-    """Call Google Gemini API"""
-    model = genai.GenerativeModel('gemini-pro')
-    response = model.generate_content(
-        prompt,
-        generation_config=genai.types.GenerationConfig(
-            temperature=0.7,
-            max_output_tokens=2000,
-        )
-    )
-    return response.text
+def _provider_available(ai_provider: str) -> bool:
+    """Configured and not rejected by its circuit breaker"""
+    provider = providers.get(ai_provider)
+    return provider is not None and provider.configured and breakers[provider.name].available()
 
-def save_result(state: Dict[str, Any]) -> Dict[str, Any]:
+def _alternate_provider(ai_provider: str) -> Optional[str]:
+    """First other registered provider that can take the call, for failover and hedging"""
+    for name in providers.names():
+        if name != ai_provider and _provider_available(name):
+            return name
+    return None
+
+async def _call_provider(ai_provider: str, messages: Messages, on_token: Optional[Callable[[str], None]] = None) -> str:
+    """One provider call behind its circuit breaker, with the breaker's adaptive timeout.
+
+    Waits first for a local slot within the provider's concurrency and rate limits;
+    that queueing time does not count toward the timeout.
+    """
+    provider = providers.get(ai_provider)
+    if provider is None:
+        raise Exception(f"Unknown AI provider: {ai_provider}")
+    if not provider.configured:
+        raise Exception(f"{provider.name} is not configured. Check its API key.")
+    name = provider.name
+    prompt_tokens = count_tokens(flatten(messages))
+    async with provider.lease(prompt_tokens) as lease:
+        provider_queue.observe(lease.waited, provider=name)
+        breaker = breakers[name]
+        if not breaker.acquire():
+            raise CircuitOpenError(f"{name} is unavailable (circuit breaker open)")
+
+        timeout = breaker.timeout()
+        started = time.perf_counter()
+        status = "error"
+        try:
+            completion = await asyncio.wait_for(provider.adapter.generate(messages, _stream_callback(name, on_token)), timeout)
+            status = "ok"
+        except asyncio.CancelledError:
+            # Bị hủy (hedge thua, client ngắt) không phải lỗi của provider
+            status = "cancelled"
+            breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            status = "timeout"
+            breaker.record_failure()
+            raise Exception(f"{name} did not answer within {timeout:.1f}s")
+        except Exception:
+            breaker.record_failure()
+            raise
+        finally:
+            provider_duration.observe(time.perf_counter() - started, provider=name, status=status)
+        breaker.record_success(time.perf_counter() - started)
+        response = completion.text
+        # Dùng usage provider trả về; không có (SDK Gemini, gateway không hỗ trợ) thì ước lượng bằng tokenizer
+        usage = completion.usage
+        prompt_tokens = usage.get("prompt_tokens", prompt_tokens)
+        completion_tokens = usage.get("completion_tokens", count_tokens(response or ""))
+        cached_tokens = usage.get("cached_tokens", 0)
+        lease.used(prompt_tokens + completion_tokens)
+    provider.record_usage(prompt_tokens, cached_tokens)
+    provider_tokens.inc(prompt_tokens, provider=name, kind="prompt")
+    provider_tokens.inc(cached_tokens, provider=name, kind="cached")
+    provider_tokens.inc(completion_tokens, provider=name, kind="completion")
+    return response
+
+async def helper_completion(messages: Messages, model: str = HELPER_MODEL, **params) -> str:
+    """Short gpt-4o-mini call (destination, history summary, route re-ask) within the gpt provider's limits and breaker.
+
+    Its outcome counts toward the breaker but its latency does not, so the adaptive
+    timeout keeps following the itinerary calls.
+    """
+    provider = providers.get("gpt")
+    if not provider.configured:
+        raise Exception(f"{provider.name} is not configured. Check its API key.")
+    breaker = breakers[provider.name]
+    prompt_tokens = count_tokens(flatten(messages))
+    async with provider.lease(prompt_tokens) as lease:
+        provider_queue.observe(lease.waited, provider=provider.name)
+        if not breaker.acquire():
+            raise CircuitOpenError(f"{provider.name} is unavailable (circuit breaker open)")
+        try:
+            response = await asyncio.wait_for(
+                provider.adapter.client.chat.completions.create(model=model, messages=messages, **params),
+                breaker.timeout()
+            )
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        text = response.choices[0].message.content or ""
+        usage = getattr(response, "usage", None)
+        lease.used(usage.total_tokens if usage else prompt_tokens + count_tokens(text))
+    return text
+
+async def _single_call(ai_provider: str, messages: Messages) -> Tuple[str, str]:
+    provider = ai_provider.lower()
+    other = _alternate_provider(provider)
+    if not breakers[provider].available() and other is not None:
+        # Breaker của provider được chọn đang mở: fail over ngay thay vì chờ timeout
+        print(f"Failing over {provider} -> {other} (circuit breaker {breakers[provider].state})")
+        provider = other
+    return await _call_provider(provider, messages), provider
+
+def hedge_delay(ai_provider: str) -> float:
+    """Seconds to wait for the primary's first token before hedging to the other provider"""
+    window = ttft_windows[ai_provider]
+    if len(window) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return min(max(window.percentile(HEDGE_PERCENTILE), HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+async def _hedged_call(ai_provider: str, messages: Messages) -> Tuple[str, str]:
+    """Race the primary provider against the other one once it stalls; (text, provider that answered)"""
+    primary = ai_provider.lower()
+    secondary = _alternate_provider(primary)
+    if secondary is None or not breakers[primary].available():
+        return await _single_call(primary, messages)
+
+    sink = token_sink.get()
+    first_token = asyncio.Event()
+    hedged = False
+
+    def primary_token(token: str) -> None:
+        first_token.set()
+        # Trước khi hedge, provider chính stream trực tiếp cho client như bình thường
+        if sink is not None and not hedged:
+            sink.put_nowait(token)
+
+    delay = hedge_delay(primary)
+    primary_task = asyncio.ensure_future(_call_provider(primary, messages, primary_token))
+    waiter = asyncio.ensure_future(first_token.wait())
+    try:
+        await asyncio.wait({primary_task, waiter}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        waiter.cancel()
+    if first_token.is_set() or primary_task.done():
+        return await primary_task, primary
+
+    # Từ đây không stream nữa: chưa biết bên nào thắng, chỉ đẩy câu trả lời thắng cuộc
+    hedged = True
+    hedge_stats["hedged"] += 1
+    print(f"Hedging {primary} -> {secondary} after {delay:.2f}s without a first token")
+    secondary_task = asyncio.ensure_future(_call_provider(secondary, messages, lambda token: None))
+    task_provider = {primary_task: primary, secondary_task: secondary}
+    try:
+        pending = set(task_provider)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task_provider[task]
+                    hedge_stats["primary_wins" if winner == primary else "secondary_wins"] += 1
+                    if sink is not None and task.result():
+                        sink.put_nowait(task.result())
+                    return task.result(), winner
+        # Cả hai đều lỗi: báo lỗi của provider chính
+        raise primary_task.exception()
+    finally:
+        for task in task_provider:
+            if not task.done():
+                task.cancel()
+
+def _stream_callback(ai_provider: str, on_token: Optional[Callable[[str], None]]):
+    """Token callback for a provider call: `on_token`, else the SSE sink, else None (no streaming).
+
+    Records time-to-first-token for the hedge delay.
+    """
+    if on_token is None:
+        sink = token_sink.get()
+        on_token = sink.put_nowait if sink is not None else None
+    if on_token is None:
+        return None
+    started = time.perf_counter()
+    first = True
+
+    def callback(token: str) -> None:
+        nonlocal first
+        if first:
+            first = False
+            ttft_windows[ai_provider].record(time.perf_counter() - started)
+        on_token(token)
+    return callback
+
+async def structure_route(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Validated route JSON for the itinerary, returned as its own typed field"""
+    if state.get("success") is False:
+        return {}
+    complete = helper_completion if _provider_available("gpt") else None
+    route = await extract_route(state.get("itinerary", ""), complete, response_cache)
+    if route and SNAP_ROUTE_ENABLED:
+        route = get_poi_index().snap_route(route, state.get("destination"), get_gazetteer())
+    return {"route": route}
+
+async def optimize_stops(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Optional stage: reorder each day's stops (start fixed, time windows kept) and report km saved"""
+    enabled = state.get("optimize_route")
+    route = state.get("route")
+    if not route or not (ROUTE_OPTIMIZE_ENABLED if enabled is None else enabled):
+        return {}
+    try:
+        # route_optimizer kéo theo numpy: chỉ import khi tính năng (opt-in) thực sự được dùng
+        route, report = lazy_import("app.route_optimizer").optimize_route(route)
+    except Exception as e:
+        print(f"Error optimizing route: {str(e)}")
+        return {"errors": [f"OptimizeRoute: {str(e)}"]}
+    return {"route": route, "route_optimization": report}
+
+def spawn_background(coro) -> asyncio.Task:
+    """Run a coroutine after the response, keeping a reference so it is not garbage collected"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+def _background_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    # Không ai await task nền: tự đọc exception để log thay vì "Task exception was never retrieved"
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Error in background task: {task.exception()!r}")
+
+async def _persist_result(state: Dict[str, Any]) -> None:
     """Save result to database (placeholder for now)"""
     # TODO: Implement MongoDB/database saving logic here
     print(f"Saving to DB (mocked) - Provider: {state.get('ai_provider', 'gpt')}")
     print(f"Input: {state.get('user_input', '')[:50]}...")
     print(f"Output length: {len(state.get('itinerary', ''))}")
-    
-    return state
 
-def return_output(state: Dict[str, Any]) -> Dict[str, Any]:
+async def save_result(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Schedule persistence in the background; runs beside return_output, off the critical path"""
+    spawn_background(_persist_result(dict(state)))
+    return {}
+
+async def return_output(state: Dict[str, Any]) -> Dict[str, Any]:
     """Return final output"""
     return {
-        **state,
         "output": state.get("itinerary", ""),
-        "success": True
+        # CallAI đặt success=False khi provider lỗi
+        "success": state.get("success") is not False
     } 
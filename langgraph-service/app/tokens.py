@@ -0,0 +1,20 @@
+from functools import lru_cache
+
+@lru_cache(maxsize=1)
+def _encoding():
+    # tiktoken là tùy chọn; không có thì ước lượng theo số ký tự
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+def count_tokens(text: str) -> int:
+    """Token count for gpt-4o style tokenizers, estimated when tiktoken is unavailable"""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Tiếng Việt có dấu tốn token hơn tiếng Anh: ~3 ký tự/token là ước lượng an toàn
+    return len(text) // 3 + 1
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the travel service.
+
+Starts the upstream stubs (bench/stubs.py) and the service pointed at them, drives
+/generate-itinerary, /generate-itinerary/stream and /api/route at each concurrency
+level, and reports throughput plus p50/p95/p99 end to end and per stage (LangGraph
+nodes, provider calls, outbound HTTP, read from /metrics). Results are written as
+JSON so runs can be compared.
+
+Usage (từ thư mục langgraph-service):
+    python -m bench.run_bench --concurrency 1,8,32 --requests 40
+    python -m bench.run_bench --scenarios stream --llm-ttft 1.5 --llm-stall-rate 0.05 --service-env HEDGE_ENABLED=true
+    python -m bench.run_bench --service-url http://localhost:8000   # service đang chạy sẵn, không khởi động stub
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from bench.stubs import add_arguments, config_from_args
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RESULTS_DIR = os.path.join(SERVICE_DIR, "bench", "results")
+SCENARIOS = ("itinerary", "stream", "route")
+STAGE_METRICS = (
+    "travel_node_duration_seconds",
+    "travel_step_duration_seconds",
+    "travel_provider_duration_seconds",
+    "travel_upstream_response_seconds",
+)
+
+# ---------------------------------------------------------------- processes
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_process(args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], cwd=SERVICE_DIR, env={**os.environ, **(env or {})})
+
+def wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{url} did not become ready within {timeout:.0f}s")
+
+def service_env(stub_url: str, extra: List[str]) -> Dict[str, str]:
+    """Point every upstream at the stubs; caches off so each request does the full work"""
+    env = {
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{stub_url}/v1",
+        "GEMINI_API_KEY": "bench",
+        "GEMINI_BASE_URL": stub_url,
+        "WIKIVOYAGE_BASE_URL": stub_url,
+        "WIKIVOYAGE_STORE_PATH": "",
+        "OPENROUTE_BASE_URL": stub_url,
+        "VITE_OPENROUTE_API_KEY": "bench",
+        "RESPONSE_CACHE_PATH": "",
+        "ROUTE_CACHE_PATH": "",
+        "ROUTE_CACHE_MEMORY_SIZE": "0",
+    }
+    for item in extra:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+# ---------------------------------------------------------------- statistics
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0), len(ordered) - 1)]
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+    return {
+        "count": len(values),
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+    }
+
+_SAMPLE = re.compile(r"^([a-zA-Z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)$")
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def parse_metrics(text: str) -> Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]:
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match:
+            labels = tuple(sorted(_LABEL.findall(match.group(2) or "")))
+            samples[(match.group(1), labels)] = float(match.group(3))
+    return samples
+
+def histogram_stages(before: Dict, after: Dict) -> Dict[str, Dict[str, Any]]:
+    """p50/p95/p99 per histogram series over the run, interpolated within buckets like histogram_quantile()"""
+    series: Dict[str, List[Tuple[float, float]]] = {}
+    for (name, labels), value in after.items():
+        base = name[:-len("_bucket")]
+        if not name.endswith("_bucket") or base not in STAGE_METRICS:
+            continue
+        le = dict(labels)["le"]
+        key = base + "{" + ",".join(f"{k}={v}" for k, v in labels if k != "le") + "}"
+        delta = value - before.get((name, labels), 0.0)
+        series.setdefault(key, []).append((float("inf") if le == "+Inf" else float(le), delta))
+
+    stages = {}
+    for key, buckets in series.items():
+        buckets.sort()
+        count = buckets[-1][1]
+        if count <= 0:
+            continue
+
+        def quantile(q: float) -> float:
+            rank, lower, previous = q * count, 0.0, 0.0
+            for bound, cumulative in buckets:
+                if cumulative >= rank:
+                    if bound == float("inf"):
+                        return lower
+                    share = (rank - previous) / (cumulative - previous) if cumulative > previous else 1.0
+                    return lower + (bound - lower) * share
+                lower, previous = bound, cumulative
+            return lower
+
+        stages[key] = {"count": int(count), **{f"p{q}_ms": round(quantile(q / 100) * 1000, 1) for q in (50, 95, 99)}}
+    return stages
+
+def provider_tokens(before: Dict, after: Dict) -> Dict[str, Dict[str, int]]:
+    """Prompt/cached/completion tokens per provider over the run (travel_provider_tokens_total deltas)"""
+    tokens: Dict[str, Dict[str, int]] = {}
+    for (name, labels), value in after.items():
+        if name != "travel_provider_tokens_total":
+            continue
+        label = dict(labels)
+        delta = int(value - before.get((name, labels), 0.0))
+        if delta:
+            tokens.setdefault(label["provider"], {})[label["kind"]] = delta
+    return tokens
+
+# ---------------------------------------------------------------- scenarios
+
+def _dalat_coordinates(rng: random.Random) -> List[List[float]]:
+    return [[round(108.44 + rng.uniform(-0.05, 0.05), 6), round(11.94 + rng.uniform(-0.05, 0.05), 6)] for _ in range(4)]
+
+async def _itinerary(client: httpx.AsyncClient, i: int, args) -> Dict[str, float]:
+    started = time.perf_counter()
+    response = await client.post("/generate-itinerary", json={
+        "text": f"Lịch trình đi Đà Lạt 2 ngày cho nhóm {i}", "ai_provider": args.provider, "bypass_cache": True})
+    response.raise_for_status()
+    if not response.json().get("success"):
+        raise RuntimeError("success=false")
+    return {"total": time.perf_counter() - started}
+
+async def _stream(client: httpx.AsyncClient, i: int, args) -> Dict[str, float]:
+    started = time.perf_counter()
+    first_token = None
+    event = None
+    async with client.stream("POST", "/generate-itinerary/stream", json={
+            "text": f"Lịch trình đi Đà Lạt 2 ngày cho nhóm {i}", "ai_provider": args.provider, "bypass_cache": True}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - started
+                elif event == "error":
+                    raise RuntimeError("error event")
+    timings = {"total": time.perf_counter() - started}
+    if first_token is not None:
+        timings["first_token"] = first_token
+    return timings
+
+async def _route(client: httpx.AsyncClient, i: int, args) -> Dict[str, float]:
+    started = time.perf_counter()
+    response = await client.post("/api/route", json={"coordinates": _dalat_coordinates(random.Random(i))})
+    response.raise_for_status()
+    return {"total": time.perf_counter() - started}
+
+_RUNNERS = {"itinerary": _itinerary, "stream": _stream, "route": _route}
+
+async def run_level(service_url: str, scenario: str, concurrency: int, requests: int, args) -> Dict[str, Any]:
+    timings: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=service_url, timeout=args.timeout, limits=limits) as client:
+        before = parse_metrics((await client.get("/metrics")).text)
+
+        async def one(i: int) -> None:
+            async with semaphore:
+                try:
+                    for name, seconds in (await _RUNNERS[scenario](client, i, args)).items():
+                        timings.setdefault(name, []).append(seconds)
+                except Exception as e:
+                    key = type(e).__name__ if not str(e) else str(e)[:80]
+                    errors[key] = errors.get(key, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+        after = parse_metrics((await client.get("/metrics")).text)
+
+    completed = len(timings.get("total", []))
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": requests,
+        "completed": completed,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 2) if elapsed else 0.0,
+        "latency": {name: summarize(values) for name, values in timings.items()},
+        "stages": histogram_stages(before, after),
+        "tokens": provider_tokens(before, after),
+    }
+
+def _print_level(result: Dict[str, Any]) -> None:
+    total = result["latency"].get("total", {})
+    line = (f"{result['scenario']:<10} c={result['concurrency']:<4} {result['throughput_rps']:>7.2f} req/s  "
+            f"p50 {total.get('p50_ms')}ms  p95 {total.get('p95_ms')}ms  p99 {total.get('p99_ms')}ms")
+    if "first_token" in result["latency"]:
+        line += f"  ttft p50 {result['latency']['first_token']['p50_ms']}ms"
+    for provider, kinds in result["tokens"].items():
+        if kinds.get("prompt"):
+            line += f"  {provider} cached {kinds.get('cached', 0) / kinds['prompt']:.0%}"
+    if result["errors"]:
+        line += f"  errors {sum(result['errors'].values())}"
+    print(line)
+    for stage, stats in sorted(result["stages"].items()):
+        if stage.startswith("travel_node_duration_seconds") or stage.startswith("travel_provider_duration_seconds"):
+            print(f"    {stage:<70} p50 {stats['p50_ms']}ms  p95 {stats['p95_ms']}ms  p99 {stats['p99_ms']}ms")
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline load test with stubbed upstreams")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma separated: %(default)s")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma separated levels (default: %(default)s)")
+    parser.add_argument("--requests", type=int, default=40, help="Requests per scenario and level")
+    parser.add_argument("--provider", default="gpt", choices=("gpt", "gemini"))
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--service-url", help="Benchmark an already running service instead of starting one")
+    parser.add_argument("--service-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the started service (repeatable)")
+    parser.add_argument("--output", help=f"Result JSON path (default: {DEFAULT_RESULTS_DIR}/bench-<time>.json)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(",") if level]
+    stub_config = config_from_args(args)
+
+    processes: List[subprocess.Popen] = []
+    try:
+        service_url = args.service_url
+        if service_url is None:
+            stub_port, service_port = free_port(), free_port()
+            stub_url = f"http://127.0.0.1:{stub_port}"
+            stub_args = [f"--{k.replace('_', '-')}={v}" for k, v in asdict(stub_config).items()]
+            processes.append(start_process(["-m", "bench.stubs", f"--port={stub_port}", *stub_args]))
+            wait_ready(f"{stub_url}/stats")
+            processes.append(start_process(
+                ["-m", "uvicorn", "app.main:app", "--port", str(service_port), "--log-level", "warning"],
+                service_env(stub_url, args.service_env)))
+            service_url = f"http://127.0.0.1:{service_port}"
+            wait_ready(f"{service_url}/health")
+
+        results = []
+        for scenario in scenarios:
+            for level in levels:
+                result = asyncio.run(run_level(service_url, scenario, level, args.requests, args))
+                _print_level(result)
+                results.append(result)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "service_url": args.service_url,
+        "provider": args.provider,
+        "service_env": args.service_env,
+        "stub_config": asdict(stub_config) if args.service_url is None else None,
+        "results": results,
+    }
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Results written to {output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
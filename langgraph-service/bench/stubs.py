@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the upstream services, for offline benchmarks.
+
+One server answers all of them:
+    POST /v1/chat/completions                           OpenAI-compatible (OPENAI_BASE_URL=<url>/v1)
+    POST /v1beta/models/{model}:generateContent         Gemini REST (GEMINI_BASE_URL=<url>)
+    POST /v1beta/models/{model}:streamGenerateContent
+    GET  /wiki/{title}                                  Wikivoyage article HTML (WIKIVOYAGE_BASE_URL=<url>)
+    POST /v2/directions/{profile}/geojson               OpenRouteService (OPENROUTE_BASE_URL=<url>)
+
+Usage (từ thư mục langgraph-service):
+    python -m bench.stubs --port 9100 --llm-ttft 0.8 --llm-tokens-per-sec 60
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, asdict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+
+@dataclass
+class StubConfig:
+    llm_ttft: float = 0.5  # giây tới token đầu tiên
+    llm_tokens_per_sec: float = 80
+    llm_output_tokens: int = 600
+    llm_stall_rate: float = 0.0  # xác suất một lần gọi bị treo (TTFT x llm_stall_factor)
+    llm_stall_factor: float = 10
+    llm_error_rate: float = 0.0
+    wiki_latency: float = 0.15
+    ors_latency: float = 0.25
+    jitter: float = 0.2  # dao động ngẫu nhiên +-20% cho mọi độ trễ
+    llm_cache_min_tokens: int = 1024  # prompt ngắn hơn không được prefix cache (như OpenAI)
+
+ROUTE = {
+    "day1": [
+        {"name": "Khách sạn trung tâm Đà Lạt", "latitude": 11.9404, "longitude": 108.4583, "time": "07:00"},
+        {"name": "Thung lũng Tình Yêu", "latitude": 11.978, "longitude": 108.448, "time": "08:30"},
+        {"name": "Hồ Xuân Hương", "latitude": 11.9416, "longitude": 108.4419, "time": "11:00"},
+        {"name": "Chợ Đà Lạt", "latitude": 11.9431, "longitude": 108.437, "time": "18:00"},
+    ],
+    "day2": [
+        {"name": "Khách sạn trung tâm Đà Lạt", "latitude": 11.9404, "longitude": 108.4583, "time": "07:00"},
+        {"name": "Thác Datanla", "latitude": 11.903, "longitude": 108.449, "time": "08:30"},
+        {"name": "Thiền viện Trúc Lâm", "latitude": 11.903, "longitude": 108.436, "time": "10:30"},
+    ],
+}
+_SENTENCE = ("Buổi sáng tham quan các điểm nổi tiếng, thưởng thức đặc sản địa phương "
+             "và di chuyển bằng xe máy với chi phí hợp lý. ").split(" ")
+
+def _delay(config: StubConfig, seconds: float) -> float:
+    return max(seconds * (1 + random.uniform(-config.jitter, config.jitter)), 0.0)
+
+def _itinerary_tokens(config: StubConfig) -> list:
+    words = [_SENTENCE[i % len(_SENTENCE)] + " " for i in range(config.llm_output_tokens)]
+    words.insert(0, "Lịch trình Đà Lạt 2 ngày\n\n**Ngày 1**\n")
+    route_block = "\n\n```json\n" + json.dumps({"route": ROUTE}, ensure_ascii=False) + "\n```"
+    return words + [route_block]
+
+def _completion_text(body: dict) -> list:
+    """Tokens of the stub answer, chosen from what the service is asking for"""
+    prompt = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return [json.dumps({"route": ROUTE}, ensure_ascii=False)]
+    if "Extract the destination" in prompt:
+        return ["Da Lat"]
+    if "PHẦN THAY ĐỔI" in prompt:
+        return [json.dumps({"route": {"day2": ROUTE["day2"][:2]}, "note": "stub"}, ensure_ascii=False)]
+    if "Tóm tắt ngắn gọn" in prompt:
+        return ["Người dùng lên kế hoạch đi Đà Lạt 2 ngày."]
+    return None
+
+class PrefixCache:
+    """Emulates provider prompt caching: prompts of at least `min_tokens` get the longest
+    previously seen prefix, in 128-token steps, reported as cached (~4 chars per token)"""
+
+    STEP = 128 * 4
+
+    def __init__(self, min_tokens: int = 1024):
+        self.minimum = min_tokens * 4
+        self._seen = set()
+
+    def usage(self, prompt: str) -> dict:
+        cached = 0
+        if len(prompt) >= self.minimum:
+            for end in range(self.STEP, len(prompt) + 1, self.STEP):
+                key = hash(prompt[:end])
+                if key in self._seen and cached == end - self.STEP:
+                    cached = end
+                self._seen.add(key)
+        if cached < self.minimum:
+            cached = 0
+        return {"prompt_tokens": len(prompt) // 4, "prompt_tokens_details": {"cached_tokens": cached // 4}}
+
+async def _paced(config: StubConfig, tokens: list):
+    """Yield tokens after the TTFT delay, at the configured token rate"""
+    ttft = config.llm_ttft
+    if random.random() < config.llm_stall_rate:
+        ttft *= config.llm_stall_factor
+    await asyncio.sleep(_delay(config, ttft))
+    started = time.perf_counter()
+    for i, token in enumerate(tokens):
+        target = started + i / config.llm_tokens_per_sec
+        wait = target - time.perf_counter()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        yield token
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="Benchmark upstream stubs")
+    stats = {"openai": 0, "gemini": 0, "wikivoyage": 0, "openroute": 0}
+    prefix_cache = PrefixCache(config.llm_cache_min_tokens)
+
+    @app.get("/stats")
+    async def get_stats():
+        return {"config": asdict(config), "requests": stats}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["openai"] += 1
+        if random.random() < config.llm_error_rate:
+            return JSONResponse({"error": {"message": "stub overloaded", "type": "server_error"}}, status_code=503)
+        tokens = _completion_text(body) or _itinerary_tokens(config)
+        prompt_usage = prefix_cache.usage("\n\n".join(str(m.get("content", "")) for m in body.get("messages", [])))
+        usage = {**prompt_usage, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_usage["prompt_tokens"] + len(tokens)}
+        meta = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": body.get("model", "stub")}
+
+        if not body.get("stream"):
+            text = "".join([token async for token in _paced(config, tokens)])
+            return {**meta, "object": "chat.completion", "choices": [{
+                "index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage}
+
+        async def events():
+            async for token in _paced(config, tokens):
+                chunk = {**meta, "object": "chat.completion.chunk", "choices": [{
+                    "index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            done = {**meta, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield f"data: {json.dumps({**meta, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1beta/models/{model_method}")
+    async def gemini(model_method: str, request: Request):
+        body = await request.json()
+        stats["gemini"] += 1
+        if random.random() < config.llm_error_rate:
+            return JSONResponse({"error": {"code": 503, "message": "stub overloaded"}}, status_code=503)
+        prompt = " ".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+        tokens = _completion_text({"messages": [{"content": prompt}]}) or _itinerary_tokens(config)
+        prompt_usage = prefix_cache.usage(prompt)
+        usage = {"promptTokenCount": prompt_usage["prompt_tokens"], "candidatesTokenCount": len(tokens),
+                 "cachedContentTokenCount": prompt_usage["prompt_tokens_details"]["cached_tokens"]}
+
+        def payload(text: str, last: bool = True) -> dict:
+            data = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}]}
+            return {**data, "usageMetadata": usage} if last else data
+
+        if model_method.endswith(":generateContent"):
+            return payload("".join([token async for token in _paced(config, tokens)]))
+
+        async def events():
+            async for token in _paced(config, tokens):
+                yield f"data: {json.dumps(payload(token, last=False), ensure_ascii=False)}\n\n"
+            yield f"data: {json.dumps(payload(''))}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/wiki/{title}")
+    async def wikivoyage(title: str):
+        stats["wikivoyage"] += 1
+        await asyncio.sleep(_delay(config, config.wiki_latency))
+        name = title.replace("_", " ")
+        sections = {
+            "Understand": f"{name} is a highland city known for its cool climate, pine forests and flower gardens.",
+            "Get in": "Lien Khuong Airport is 30 km south of the centre. Sleeper buses run overnight from Ho Chi Minh City.",
+            "See": "Xuan Huong Lake, the Crazy House, Datanla Falls and the Bao Dai Summer Palace.",
+            "Eat": "Try banh can, grilled rice paper and artichoke tea at the night market.",
+            "Sleep": "Guesthouses around the market start at 300,000 dong per night.",
+        }
+        body = "".join(f"<h2>{heading}</h2><p>{text}</p>" for heading, text in sections.items())
+        return HTMLResponse(f"<html><body><h1>{name}</h1><div id=\"mw-content-text\">{body}</div></body></html>")
+
+    @app.post("/v2/directions/{profile}/geojson")
+    async def directions(profile: str, request: Request):
+        body = await request.json()
+        stats["openroute"] += 1
+        await asyncio.sleep(_delay(config, config.ors_latency))
+        coordinates = body.get("coordinates") or []
+        return {"type": "FeatureCollection", "features": [{
+            "type": "Feature",
+            "properties": {"summary": {"distance": 1000.0 * len(coordinates), "duration": 120.0 * len(coordinates)}},
+            "geometry": {"type": "LineString", "coordinates": coordinates}}]}
+
+    return app
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = StubConfig()
+    for field, value in asdict(defaults).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(**{field: getattr(args, field) for field in asdict(StubConfig())})
+
+def main(argv=None) -> int:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the benchmark upstream stubs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,46 +1,104 @@
 #!/usr/bin/env python3
 """
 Script to run the LangGraph Travel Planning Service
+
+    python run.py                        # dev: một process, auto-reload
+    python run.py --mode prod            # production: N worker, uvloop/httptools, warm-up trước khi nhận request
+    python run.py --startup-report       # import app, chạy startup hook, in thời gian từng phase (JSON) rồi thoát
 """
 
-import uvicorn
+import argparse
+import asyncio
+import importlib.util
+import json
 import os
+import sys
+import uvicorn
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-if __name__ == "__main__":
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def startup_report() -> int:
+    """Print this process's startup timings as one JSON line (append to a file to track them over time)"""
+    os.environ.setdefault("WARMUP_ENABLED", "true")
+    from app.main import app
+    from app.startup import startup_report as report
+
+    async def run_hooks():
+        await app.router.startup()
+        await app.router.shutdown()
+
+    asyncio.run(run_hooks())
+    print(json.dumps(report.as_dict(), ensure_ascii=False))
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the LangGraph Travel Planning Service")
+    parser.add_argument("--mode", choices=("dev", "prod"), default=os.getenv("RUN_MODE", "dev"))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", 0)),
+                        help="Worker processes in prod mode (default: CPU count)")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="Import the app, run the startup hooks, print the phase timings and exit")
+    args = parser.parse_args(argv)
+
+    if args.startup_report:
+        return startup_report()
+
     # Get configuration from environment variables
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("LANGGRAPH_PORT", 8000))
-    
-    print(f"🚀 Starting LangGraph Travel Planning Service...")
+    prod = args.mode == "prod"
+    workers = (args.workers or os.cpu_count() or 1) if prod else 1
+
+    print(f"🚀 Starting LangGraph Travel Planning Service ({args.mode}, {workers} worker(s))...")
     print(f"📍 Server will run on: http://{host}:{port}")
     print(f"📋 API Documentation: http://{host}:{port}/docs")
     print(f"🔍 Health Check: http://{host}:{port}/health")
-    
+
     # Check if API keys are configured
     openai_key = os.getenv("OPENAI_API_KEY")
-    print(openai_key)
     gemini_key = os.getenv("GEMINI_API_KEY")
-    print(gemini_key)
-    
+
     print("\n🔑 API Keys Status:")
     print(f"  OpenAI: {'✅ Configured' if openai_key else '❌ Not configured'}")
     print(f"  Gemini: {'✅ Configured' if gemini_key else '❌ Not configured'}")
-    
+
     if not openai_key and not gemini_key:
         print("\n⚠️  Warning: No API keys configured! Please set OPENAI_API_KEY or GEMINI_API_KEY")
-    
+
     print("\n" + "="*50)
-    
-    # Run the server
+
+    if not prod:
+        # Run the server
+        uvicorn.run(
+            "app.main:app",
+            host=host,
+            port=port,
+            reload=True,
+            reload_dirs=["app"],
+            log_level="info"
+        )
+        return 0
+
+    # Worker kế thừa biến môi trường: mỗi worker warm-up rồi mới nhận request
+    os.environ.setdefault("WARMUP_ENABLED", "true")
     uvicorn.run(
         "app.main:app",
         host=host,
         port=port,
-        reload=True,
-        reload_dirs=["app"],
-        log_level="info"
-    ) 
\ No newline at end of file
+        workers=workers,
+        loop="uvloop" if _available("uvloop") else "asyncio",
+        http="httptools" if _available("httptools") else "h11",
+        log_level=os.getenv("LOG_LEVEL", "info"),
+        access_log=os.getenv("ACCESS_LOG", "false").lower() in ("1", "true", "yes"),
+        proxy_headers=True,
+        timeout_keep_alive=int(os.getenv("KEEPALIVE_TIMEOUT", 5))
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+from app.breaker import CircuitBreaker
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        assert breaker.acquire()
+        breaker.record_failure()
+
+def test_opens_at_failure_rate():
+    breaker = CircuitBreaker("test", window=10, min_calls=4, failure_rate=0.5)
+    breaker.record_success(0.1)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"  # chưa đủ min_calls
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.acquire()
+    assert breaker.rejected == 1 and breaker.trips == 1
+
+def test_stays_closed_below_failure_rate():
+    breaker = CircuitBreaker("test", window=10, min_calls=4, failure_rate=0.5)
+    for _ in range(3):
+        breaker.record_success(0.1)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+def test_half_open_allows_single_probe(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.breaker.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", window=10, min_calls=4, failure_rate=0.5, open_seconds=30)
+    trip(breaker)
+    assert breaker.state == "open"
+
+    now[0] += 30
+    assert breaker.state == "half_open"
+    assert breaker.acquire()
+    assert not breaker.acquire()  # chỉ một probe
+
+    breaker.record_success(0.1)
+    assert breaker.state == "closed"
+    assert breaker.stats()["calls"] == 0  # cửa sổ được reset khi đóng lại
+
+def test_failed_probe_reopens(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.breaker.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", window=10, min_calls=4, failure_rate=0.5, open_seconds=30)
+    trip(breaker)
+    now[0] += 30
+    assert breaker.acquire()
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.trips == 2
+    now[0] += 29
+    assert breaker.state == "open"
+
+def test_released_probe_can_be_retried(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.breaker.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", window=10, min_calls=4, failure_rate=0.5, open_seconds=30)
+    trip(breaker)
+    now[0] += 30
+    assert breaker.acquire()
+    breaker.release()
+    assert breaker.state == "half_open" and breaker.acquire()
+
+def test_timeout_follows_p99():
+    breaker = CircuitBreaker("test", window=10, min_calls=4, default_timeout=60, min_timeout=1, max_timeout=120)
+    assert breaker.timeout() == 60
+    for _ in range(4):
+        breaker.record_success(2.0)
+    assert breaker.timeout() == 4.0
@@ -0,0 +1,42 @@
+from app import context_store
+from app.context_store import bm25_scores
+
+def test_bm25_prefers_rarer_terms_and_higher_tf():
+    postings = {"food": [(0, 1), (1, 3)], "city": [(0, 1), (1, 1), (2, 1)]}
+    lengths = {0: 10, 1: 10, 2: 10}
+    scores = bm25_scores(["food", "city", "unknown"], postings, lengths, 3, 10.0)
+    assert scores[1] > scores[0] > scores[2] > 0
+
+def test_search_ranks_sections(tmp_path):
+    path = str(tmp_path / "wikivoyage.sqlite3")
+    context_store.build_store(path, [
+        ("Da Lat", [("Eat", "Night market food and grilled rice paper"), ("Sleep", "Hotels near the lake")]),
+        ("Hue", [("Eat", "Royal cuisine and food stalls")]),
+    ])
+    store = context_store.ContextStore(path)
+    article = store.find_article("Da Lat")
+    assert article is not None
+    results = store.search("food market", k=2, article_id=article)
+    assert [section.heading for _, section in results][0] == "Eat"
+
+def test_context_store_is_picked_up_after_ingest(tmp_path, monkeypatch):
+    path = tmp_path / "wikivoyage.sqlite3"
+    monkeypatch.setenv("WIKIVOYAGE_STORE_PATH", str(path))
+    monkeypatch.setattr(context_store, "_store", None)
+    assert context_store.get_context_store() is None
+
+    context_store.build_store(str(path), [("Da Lat", [("Eat", "Night market food")])])
+    store = context_store.get_context_store()
+    assert store is not None and store.total_sections == 1
+    assert context_store.get_context_store() is store
+
+def test_context_store_is_reopened_after_reingest(tmp_path, monkeypatch):
+    path = tmp_path / "wikivoyage.sqlite3"
+    monkeypatch.setenv("WIKIVOYAGE_STORE_PATH", str(path))
+    monkeypatch.setattr(context_store, "_store", None)
+    context_store.build_store(str(path), [("Da Lat", [("Eat", "Night market food")])])
+    old = context_store.get_context_store()
+
+    context_store.build_store(str(path), [("Da Lat", [("Eat", "Food")]), ("Hue", [("Eat", "Royal cuisine")])])
+    store = context_store.get_context_store()
+    assert store is not old and store.total_sections == 2
@@ -0,0 +1,69 @@
+from app.patching import apply_patch, parse_patch, parse_route, split_sections
+
+PREVIOUS = """## Ngày 1
+Dinh Độc Lập, chợ Bến Thành
+
+## Ngày 2
+Địa đạo Củ Chi
+
+## Chi phí
+Khoảng 3 triệu
+
+```json
+{"route": {"day1": [{"name": "Dinh Độc Lập", "latitude": 10.777, "longitude": 106.695, "time": "08:00"}],
+           "day2": [{"name": "Địa đạo Củ Chi", "latitude": 11.141, "longitude": 106.462, "time": "08:00"}]}}
+```"""
+
+STOP = {"name": "Bảo tàng Chứng tích Chiến tranh", "latitude": 10.779, "longitude": 106.692, "time": "09:00"}
+
+def test_split_sections_ignores_route_block():
+    assert len(split_sections(PREVIOUS.split("```json")[0])) == 3
+
+def test_replace_section_and_day():
+    result = apply_patch(PREVIOUS, {"sections": {"S2": "## Ngày 2\nBảo tàng"}, "route": {"day2": [STOP]}})
+    assert "Bảo tàng" in result and "Củ Chi" not in result
+    assert parse_route(result)["day2"] == [STOP]
+    assert parse_route(result)["day1"][0]["name"] == "Dinh Độc Lập"
+
+def test_remove_and_add_sections():
+    result = apply_patch(PREVIOUS, {"remove_sections": ["S3"], "new_sections": ["## Ghi chú\nMang áo mưa"]})
+    assert "Chi phí" not in result
+    assert result.split("```json")[0].strip().endswith("Mang áo mưa")
+
+def test_new_day_is_added_in_order():
+    result = apply_patch(PREVIOUS, {"route": {"day10": [STOP], "day3": [STOP]}})
+    assert list(parse_route(result)) == ["day1", "day2", "day3", "day10"]
+
+def test_removing_missing_day_is_a_no_op():
+    result = apply_patch(PREVIOUS, {"route": {"day5": []}})
+    assert list(parse_route(result)) == ["day1", "day2"]
+
+def test_empty_list_removes_day():
+    assert list(parse_route(apply_patch(PREVIOUS, {"route": {"day2": []}}))) == ["day1"]
+
+def test_unknown_section_id_is_ignored():
+    result = apply_patch(PREVIOUS, {"sections": {"S9": "x"}})
+    assert split_sections(result.split("```json")[0]) == split_sections(PREVIOUS.split("```json")[0])
+
+def test_malformed_patches_return_none():
+    assert apply_patch(PREVIOUS, None) is None
+    assert apply_patch(PREVIOUS, ["not", "a", "dict"]) is None
+    assert apply_patch(PREVIOUS, {"sections": ["S1"]}) is None
+    assert apply_patch(PREVIOUS, {"new_sections": "## Ngày 3"}) is None
+    assert apply_patch(PREVIOUS, {"route": [STOP]}) is None
+    assert apply_patch(PREVIOUS, {"route": {"day1": STOP}}) is None
+    assert apply_patch(PREVIOUS, {"route": {"day1": [{"name": "Không tọa độ"}]}}) is None
+    assert apply_patch(PREVIOUS, {"route": {"day1": [dict(STOP, latitude="north")]}}) is None
+
+def test_parse_patch():
+    assert parse_patch('{"sections": {"S1": "## Ngày 1"}, "note": "ok"}') == {"sections": {"S1": "## Ngày 1"}, "note": "ok"}
+    assert parse_patch('Đây là patch:\n```json\n{"route": {"day1": []}}\n```') == {"route": {"day1": []}}
+    assert parse_patch("không có JSON") is None
+    assert parse_patch('{"route": ') is None
+    assert parse_patch("") is None
+
+def test_parse_patch_rejects_non_patches():
+    assert parse_patch('{"note": "không đổi gì"}') is None
+    assert parse_patch('{"sections": {}, "itinerary": "..."}') is None
+    # Model trả về cả lịch trình thay vì patch: block route không được coi là patch chỉ đổi route
+    assert parse_patch(PREVIOUS) is None
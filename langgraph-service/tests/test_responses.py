@@ -0,0 +1,81 @@
+import gzip
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.responses import CompressionMiddleware, _brotli, select_fields
+
+BODY = "Lịch trình Đà Lạt 3 ngày. " * 200
+
+def make_client(**kwargs) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, **kwargs)
+
+    @app.get("/large")
+    def large():
+        return PlainTextResponse(BODY)
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("ok")
+
+    @app.get("/events")
+    def events():
+        return StreamingResponse(iter([f"data: {BODY}\n\n"] * 2), media_type="text/event-stream")
+
+    @app.get("/chunks")
+    def chunks():
+        return StreamingResponse(iter([BODY, BODY]), media_type="text/plain")
+
+    return TestClient(app)
+
+def get(client, path, encoding):
+    # httpx tự giải nén gzip: đọc raw bytes để kiểm tra đúng những gì server gửi
+    with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+def test_gzip_when_accepted():
+    response, raw = get(make_client(), "/large", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) == len(raw) < len(BODY.encode())
+    assert gzip.decompress(raw).decode() == BODY
+
+def test_identity_when_not_accepted():
+    response, raw = get(make_client(), "/large", "identity")
+    assert "content-encoding" not in response.headers
+    assert raw.decode() == BODY
+
+def test_brotli_preferred_only_when_installed():
+    response, _ = get(make_client(), "/large", "br, gzip")
+    expected = "br" if _brotli() is not None else "gzip"
+    assert response.headers["content-encoding"] == expected
+
+def test_small_bodies_are_not_compressed():
+    response, raw = get(make_client(minimum_size=1024), "/small", "gzip")
+    assert "content-encoding" not in response.headers
+    assert raw == b"ok"
+
+def test_minimum_size_is_configurable():
+    response, raw = get(make_client(minimum_size=1), "/small", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(raw) == b"ok"
+
+def test_event_streams_are_left_alone():
+    response, raw = get(make_client(), "/events", "gzip")
+    assert "content-encoding" not in response.headers
+    assert raw.decode().startswith("data: ")
+
+def test_multi_part_bodies_are_compressed_incrementally():
+    response, raw = get(make_client(), "/chunks", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert gzip.decompress(raw).decode() == BODY * 2
+
+def test_select_fields():
+    state = {"itinerary": "x", "success": True, "prompt": "p"}
+    default = ("itinerary", "success", "output")
+    assert select_fields(state, None, default) == {"itinerary": "x", "success": True}
+    assert select_fields(state, ["*"], default) == state
+    assert select_fields(state, ["prompt", "missing"], default) == {"prompt": "p"}
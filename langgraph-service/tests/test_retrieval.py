@@ -0,0 +1,32 @@
+from app.retrieval import Chunk, expand_query, select_chunks
+
+def chunk(position, heading, text, tokens=10):
+    return Chunk(position, heading, text, tokens)
+
+CHUNKS = [
+    chunk(0, "Understand", "Da Lat is a highland city with a cool climate."),
+    chunk(1, "Eat", "Try the night market food, grilled rice paper and artichoke tea. Restaurants near the lake."),
+    chunk(2, "Sleep", "Hotels and homestays cluster around the market."),
+    chunk(3, "Get around", "Motorbike taxi and buses connect the city."),
+]
+
+def test_select_chunks_ranks_and_keeps_article_order():
+    selected = select_chunks(CHUNKS, "food restaurant market", token_budget=100, top_k=2)
+    assert [c.heading for c in selected] == ["Eat", "Sleep"]
+
+def test_select_chunks_respects_token_budget():
+    selected = select_chunks(CHUNKS, "food restaurant market", token_budget=15, top_k=3)
+    assert [c.heading for c in selected] == ["Eat"]
+    assert select_chunks(CHUNKS, "food", token_budget=0, top_k=3) == []
+
+def test_expand_query_maps_vietnamese_intents():
+    assert "eat food restaurant" in expand_query("Gợi ý đồ ăn ở Đà Lạt")
+    assert "budget cheap" in expand_query("Khách sạn giá rẻ ở Huế")
+    assert "get in train" in expand_query("Đi tàu hỏa ra Hà Nội")
+
+def test_expand_query_ignores_folded_single_syllables():
+    base = len(expand_query("").split())
+    for text in ("Lịch trình Hội An cho tôi", "Khách ở Quận 1, rẽ trái", "Ngủ ngon, xe đạp, chơi"):
+        assert len(expand_query(text).split()) == len(text.split()) + base
+    # Cụm phải khớp trọn token: "giá cả" không khớp trong "giá cảnh"
+    assert "price cost" not in expand_query("giá cảnh quan")
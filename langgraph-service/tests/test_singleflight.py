@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert [value for value, _ in results] == ["value"] * 5
+    assert sum(shared for _, shared in results) == 4
+    assert len(calls) == 1
+    assert flight.stats() == {"calls": 1, "coalesced": 4, "in_flight": 0}
+
+def test_error_reaches_every_waiter_and_is_not_cached():
+    flight = SingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flight.stats()["in_flight"] == 0
+        # Lỗi không được giữ lại: lần gọi sau chạy lại upstream
+        return await flight.do("k", lambda: asyncio.sleep(0, result="ok"))
+
+    assert asyncio.run(main()) == ("ok", False)
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    flight = SingleFlight("test")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("k", slow))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == ("value", True)
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight("test")
+
+    async def main():
+        return await asyncio.gather(flight.do("a", lambda: asyncio.sleep(0.01, result="a")),
+                                    flight.do("b", lambda: asyncio.sleep(0.01, result="b")))
+
+    assert asyncio.run(main()) == [("a", False), ("b", False)]